@@ -0,0 +1,184 @@
+from typing import Callable, Dict, List, Optional
+import itertools, json, logging, os, queue, select, threading, uuid
+import psycopg2
+
+logger = logging.getLogger('uvicorn.error')
+
+# How a broadcast reaches the WebSocket clients of every uvicorn worker. Each worker delivers to its own
+# sockets, the backplane carries what one worker broadcasts over to the others:
+#   local     a single worker, nothing to carry (the default)
+#   postgres  LISTEN/NOTIFY on the database we already run
+BACKPLANE = os.getenv("WEBSOCKET_BACKPLANE", "local")
+
+CHANNEL = "websocket_broadcasts"
+# NOTIFY payloads have to stay under 8000 bytes, bigger messages go out in parts within one transaction
+MAX_PART = 7000
+# messages sent together in one transaction when they queue up
+MAX_BATCH = 100
+RECONNECT_SECONDS = 2
+
+# data & topics of a message from another worker, called on the backplane's thread
+Deliver = Callable[[str, List[str]], None]
+
+# Besides broadcasts workers send each other signals, named events that aren't for the clients (a cache
+# to clear). Handlers are called on the backplane's thread.
+signal_handlers: Dict[str, Callable[[], None]] = {}
+
+
+def on_signal(name: str, handler: Callable[[], None]):
+    signal_handlers[name] = handler
+
+
+# A connection of its own, out of the pool, for as long as the caller keeps it
+def connect():
+    from database import engine
+    connection = engine.raw_connection()
+    connection.detach()
+    return connection.dbapi_connection
+
+
+class LocalBackplane:
+    def start(self, deliver: Deliver):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, data: str, topics: List[str]):
+        pass
+
+    def signal(self, name: str):
+        pass
+
+
+class PostgresBackplane:
+    def __init__(self):
+        self.worker = uuid.uuid4().hex
+        self.sequence = itertools.count()
+        self.outbox: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self.stopping = threading.Event()
+        self.deliver: Optional[Deliver] = None
+        self.threads: List[threading.Thread] = []
+
+    def start(self, deliver: Deliver):
+        self.deliver = deliver
+        self.stopping.clear()
+        self.threads = [
+            threading.Thread(target=self.send_loop, name="backplane-send", daemon=True),
+            threading.Thread(target=self.listen_loop, name="backplane-listen", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.outbox.put(None)
+        for thread in self.threads:
+            thread.join(RECONNECT_SECONDS + 1)
+        self.threads = []
+
+    # Never blocks, the NOTIFYs are sent from the backplane's own thread
+    def publish(self, data: str, topics: List[str]):
+        self.outbox.put({"topics": topics, "data": data})
+
+    def signal(self, name: str):
+        self.outbox.put({"signal": name})
+
+    # "<worker> <message> <part> <parts> <text>" for every part of a message
+    def payloads(self, message: dict) -> List[str]:
+        # ASCII only, so MAX_PART characters are MAX_PART bytes
+        envelope = json.dumps(message)
+        parts = [envelope[i : i + MAX_PART] for i in range(0, len(envelope), MAX_PART)]
+        sequence = next(self.sequence)
+        return [f"{self.worker} {sequence} {index} {len(parts)} {part}" for index, part in enumerate(parts)]
+
+    def send_loop(self):
+        connection = None
+        while True:
+            batch = [self.outbox.get()]
+            while batch[-1] is not None and len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.outbox.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            batch = [message for message in batch if message is not None]
+            if batch:
+                try:
+                    if connection is None:
+                        connection = connect()
+                    with connection.cursor() as cursor:
+                        for message in batch:
+                            for payload in self.payloads(message):
+                                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+                    connection.commit()
+                except psycopg2.Error as e:
+                    logger.error(f"WebSocket backplane dropped {len(batch)} messages: {e}")
+                    connection = self.close(connection)
+            if stop:
+                self.close(connection)
+                return
+
+    def listen_loop(self):
+        while not self.stopping.is_set():
+            connection = None
+            # parts of messages still coming in, by worker & message
+            parts = {}
+            try:
+                connection = connect()
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                while not self.stopping.is_set():
+                    if not select.select([connection], [], [], 1)[0]:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        payload = connection.notifies.pop(0).payload
+                        # one bad message (a payload we can't read, a deliver or signal handler
+                        # that raises) is dropped, the listener keeps going
+                        try:
+                            self.receive(payload, parts)
+                        except Exception:
+                            logger.exception(f"WebSocket backplane dropped a message: {payload[:200]!r}")
+            except psycopg2.Error as e:
+                logger.error(f"WebSocket backplane lost its database connection: {e}")
+                self.stopping.wait(RECONNECT_SECONDS)
+            finally:
+                self.close(connection)
+
+    def receive(self, payload: str, parts: dict):
+        worker, message, index, count, text = payload.split(" ", 4)
+        if worker == self.worker:
+            # our own, already delivered here
+            return
+        if count != "1":
+            received = parts.setdefault((worker, message), {})
+            received[int(index)] = text
+            if len(received) < int(count):
+                return
+            del parts[(worker, message)]
+            text = "".join(received[i] for i in range(int(count)))
+        envelope = json.loads(text)
+        if "signal" in envelope:
+            handler = signal_handlers.get(envelope["signal"])
+            if handler is not None:
+                handler()
+        else:
+            self.deliver(envelope["data"], envelope["topics"])
+
+    def close(self, connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except psycopg2.Error:
+                pass
+        return None
+
+
+def create_backplane():
+    if BACKPLANE == "postgres":
+        return PostgresBackplane()
+    if BACKPLANE != "local":
+        raise ValueError(f"Unknown WEBSOCKET_BACKPLANE {BACKPLANE!r}, expected local or postgres")
+    return LocalBackplane()
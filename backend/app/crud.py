@@ -1,57 +1,20 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import cast, func
-from sqlalchemy.dialects.postgresql import JSONB, ARRAY
+from sqlalchemy import cast, event, func, text, update, Float, Numeric
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY, insert
 from sqlalchemy.exc import IntegrityError, NoResultFound
-import operator, json, datetime, os, time, socket
-import tempfile, logging
-from io import BytesIO
-from PIL import Image
-import imgkit
-import StarTSPImage
-import math
+import operator, json, datetime
+import logging
 from fastapi import HTTPException
-from typing import List, Optional
-import models, schemas
+from typing import Callable, Dict, List, Optional, Tuple
+import models, schemas, pricing, realtime, layout, printers
+from renderer import renderer, RendererBusy
+from spooler import spooler
 from tzlocal import get_localzone
 import pytz
 from functools import wraps
 
 logger = logging.getLogger('uvicorn.error')
 
-def get_style(font_size):
-    res_factor = math.ceil((1 / 25.4) * 203)
-    pad_left_per_px = 0.4226
-    return f"""
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Roboto:ital,wght@0,100;0,200;0,300;0,400;0,500;0,700&display=swap');
-            body {{
-                width: {80*res_factor}mm;
-                font-family: Roboto;
-                margin: 0;
-            }}
-            p, span {{
-                margin: {2*res_factor}px 0;
-                font-size: {font_size*res_factor}px;
-                font-weight: 400;
-            }}
-            .center {{
-                text-align: center;
-            }}
-            .item {{
-                display: flex;
-                justify-content: space-between;
-            }}
-            .item-details {{
-                padding-left: {font_size*pad_left_per_px*res_factor}mm;
-            }}
-            hr {{
-                border: none;
-                border-top: {res_factor}px solid #000;
-            }}
-        </style>
-        """
-
-
 # Fetch items
 def get_items(db: Session):
     return db.query(models.Item).order_by(models.Item.id.asc()).all()
@@ -82,9 +45,13 @@ def create_category(db: Session, category: schemas.CategoryCreate):
 # Create a new item
 def create_item(db: Session, item: schemas.ItemCreate):
     db_item = models.Item(**item.model_dump())
+    db_item.price_table = pricing.build_price_table(db_item.form_cfg, db_item.tax_rate)
     db.add(db_item)
+    db.flush()
+    sync_inventory_balances(db, db_item)
     db.commit()
     db.refresh(db_item)
+    pricing.compile_plan(db_item)
     return db_item
 
 
@@ -93,8 +60,13 @@ def update_item(db: Session, db_item: schemas.Item, item: schemas.ItemUpdate):
     item_data = item.model_dump(exclude_unset=True)
     for key, value in item_data.items():
         setattr(db_item, key, value)
+    db_item.price_table = pricing.build_price_table(db_item.form_cfg, db_item.tax_rate)
+    db_item.version = models.Item.version + 1
+    if "inventory_config" in item_data:
+        sync_inventory_balances(db, db_item)
     db.commit()
     db.refresh(db_item)
+    pricing.compile_plan(db_item)
     return db_item
 
 
@@ -102,8 +74,89 @@ def update_item(db: Session, db_item: schemas.Item, item: schemas.ItemUpdate):
 def delete_item(db: Session, db_item: schemas.Item):
     db.delete(db_item)
     db.commit()
+    pricing.invalidate_plan(db_item.id)
+    inventory_configs.pop(db_item.id, None)
     return db_item
 
+# Every change to an order is written to order_events by the transaction making it, the event's id
+# being its sequence number, and published to the terminals as an order-event message once committed.
+# A terminal that was offline asks for the events since the last id it saw instead of reloading its
+# lists. Snapshots are taken right before the commit so they hold what's committed.
+ORDER_EVENT_TTL = datetime.timedelta(days=1)
+# Held from writing the events until the commit, so events commit in the order of their ids and a
+# terminal that saw an id has also seen every one before it
+ORDER_EVENTS_LOCK = 7370002
+MAX_ORDER_EVENTS = 1000
+
+
+def order_snapshot(db_order: models.Order) -> Dict:
+    return schemas.Order.model_validate(db_order).model_dump(mode="json")
+
+
+def order_line_snapshot(db: Session, db_order_item: models.OrderItem) -> Dict:
+    # quantity may have been incremented in SQL, configurations are a cast until reloaded
+    db.refresh(db_order_item)
+    return schemas.OrderLine.model_validate(db_order_item).model_dump(mode="json")
+
+
+def record_order_event(db: Session, order_id: int, kind: str, snapshot: Callable[[], Dict] = dict):
+    db.info.setdefault("order_events", []).append((order_id, kind, snapshot))
+
+
+@event.listens_for(Session, "before_commit")
+def write_order_events(db: Session):
+    if not db.info.get("order_events"):
+        return
+    # before taking the lock, so it isn't held while waiting on rows someone else has locked
+    db.flush()
+    events = [
+        {"order_id": order_id, "kind": kind, "payload": snapshot()}
+        for order_id, kind, snapshot in db.info.pop("order_events")
+    ]
+    db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ORDER_EVENTS_LOCK})
+    written = db.execute(
+        insert(models.OrderEvent).returning(models.OrderEvent.id, models.OrderEvent.created_at, sort_by_parameter_order=True),
+        events,
+    )
+    db.info["order_events_written"] = [
+        dict(event, id=id, created_at=created_at) for event, (id, created_at) in zip(events, written)
+    ]
+
+
+@event.listens_for(Session, "after_commit")
+def publish_order_events(db: Session):
+    for order_event in db.info.pop("order_events_written", []):
+        realtime.manager.publish({"type": "order-event", "payload": schemas.OrderEvent(**order_event).model_dump(mode="json")})
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_order_events(db: Session):
+    db.info.pop("order_events", None)
+    db.info.pop("order_events_written", None)
+
+
+def get_order_events(db: Session, since: int, limit: int = MAX_ORDER_EVENTS):
+    events = (
+        db.query(models.OrderEvent)
+        .filter(models.OrderEvent.id > since)
+        .order_by(models.OrderEvent.id)
+        .limit(min(limit, MAX_ORDER_EVENTS))
+        .all()
+    )
+    first_id, last_id = db.query(func.min(models.OrderEvent.id), func.max(models.OrderEvent.id)).one()
+    return schemas.OrderEventFeed(
+        events=events,
+        last_id=last_id or 0,
+        reset=since > (last_id or 0) or (first_id is not None and since < first_id - 1),
+    )
+
+
+def prune_order_events(db: Session):
+    expires_before = datetime.datetime.now(datetime.timezone.utc) - ORDER_EVENT_TTL
+    db.query(models.OrderEvent).filter(models.OrderEvent.created_at < expires_before).delete(synchronize_session=False)
+    db.commit()
+
+
 def update_last_interaction(func):
     @wraps(func)
     def wrapper(db: Session, *args, **kwargs):
@@ -122,6 +175,7 @@ def create_order(db: Session):
     db.refresh(db_order)
     db_order_transaction = models.Transaction(order_id=db_order.id)
     db.add(db_order_transaction)
+    record_order_event(db, db_order.id, "created", lambda: order_snapshot(db_order))
     db.commit()
     db.refresh(db_order_transaction)
     return db_order
@@ -131,6 +185,10 @@ def add_to_active_order(
     db: Session, db_order: schemas.Order, db_item: schemas.Item, configurations: list
 ):
 
+    # Lock the order until the commit, so concurrent adds of a configuration that isn't on it yet can't
+    # both miss the lookup below and insert a line each
+    db.query(models.Order.id).filter(models.Order.id == db_order.id).with_for_update().one()
+
     # Check if the item is already in the order with the same configurations
     matched_order_item = (
         db.query(models.OrderItem)
@@ -143,12 +201,16 @@ def add_to_active_order(
     )
 
     if matched_order_item:
-        matched_order_item.quantity += 1
+        # increment in SQL so concurrent adds of the same configuration can't lose a unit
+        db.execute(
+            update(models.OrderItem)
+            .where(models.OrderItem.id == matched_order_item.id)
+            .values(quantity=models.OrderItem.quantity + 1)
+        )
+        order_item = matched_order_item
     else:
         # If not, create and add new OrderItem
-        price, taxed = calculate_prices(
-            db_item.form_cfg, configurations, db_item.tax_rate
-        )
+        price, taxed = pricing.get_plan(db_item).price(configurations)
         new_order_item = models.OrderItem(
             order_id=db_order.id,
             item_id=db_item.id,
@@ -158,19 +220,22 @@ def add_to_active_order(
             tax=taxed,
         )
         db.add(new_order_item)
+        db.flush()
+        order_item = new_order_item
 
-    db.commit()
+    record_order_event(db, db_order.id, "item-added", lambda: order_line_snapshot(db, order_item))
+    # commits the order item together with its inventory change
+    evaluate_inventory(db, [order_item], 'decrement', True)
     db.refresh(db_order)
 
-    evaluate_inventory(db, [new_order_item if not matched_order_item else matched_order_item], 'decrement', True)
-
     return db_order
 
 @update_last_interaction
 def update_order(db: Session, order_id: int, order: schemas.Order):
     try:
         # Fetch the order and transaction
-        db_order = db.query(models.Order).filter(models.Order.id == order_id).one()
+        # locked before the balances settled below, in the same order add_to_active_order takes them
+        db_order = db.query(models.Order).filter(models.Order.id == order_id).with_for_update().one()
         db_order_transaction = (
             db.query(models.Transaction)
             .filter(models.Transaction.order_id == order_id)
@@ -183,12 +248,17 @@ def update_order(db: Session, order_id: int, order: schemas.Order):
     update_order_data = order.model_dump(exclude_unset=True)
     update_transaction_data = update_order_data.pop("transaction", {})
 
+    # stock held while the order was pending is taken for good once it's submitted
+    if db_order.status == "pending" and update_order_data.get("status", "pending") != "pending":
+        settle_reservations(db, order_id)
+
     for key, value in update_order_data.items():
         setattr(db_order, key, value)
 
     for key, value in update_transaction_data.items():
         setattr(db_order_transaction, key, value)
 
+    record_order_event(db, order_id, "updated", lambda: order_snapshot(db_order))
     # Commit the transaction
     db.commit()
 
@@ -212,6 +282,10 @@ def get_orders(db: Session, status: str):
 
 
 def delete_order(db: Session, db_order: schemas.Order):
+    # the order before the balances its reservations go back to, like add_to_active_order
+    db.query(models.Order.id).filter(models.Order.id == db_order.id).with_for_update().one()
+    if db_order.status == "pending":
+        release_reservations(db, db_order.id)
     db.delete(db_order)
     db_transaction = (
         db.query(models.Transaction)
@@ -221,6 +295,7 @@ def delete_order(db: Session, db_order: schemas.Order):
     if db_transaction.payment_method: 
         raise HTTPException(status_code=400, detail="Cannot delete an order with a payment")
     db.delete(db_transaction)
+    record_order_event(db, db_order.id, "deleted")
     db.commit()
     return db_order
 
@@ -232,245 +307,185 @@ def print_receipt(db: Session, db_order: schemas.Order):
         .first()
     )
     db_order_items = get_order_items(db, db_order.id)
-    db_restaurant = db.query(models.Restaurant).first()
-    db_printer = db.query(models.Printer).filter(models.Printer.name == "front").first()
-    receipt_style = get_style(16)
+    db_restaurant = printers.get_restaurant(db)
+    db_printer = printers.get_printer(db, printers.FRONT_PRINTER)
+    if db_printer is None:
+        raise HTTPException(status_code=404, detail="Printer not found")
     if db_order:
         local_tz = get_localzone()
         order_date = datetime.datetime.now(local_tz).strftime("%m/%d/%Y %I:%M:%S %p")
-        # scale up to max out print resolution ((80mm width / 25.4 mm per inch) * 203 dpi) / 80mm width
-        res_factor = math.ceil((1 / 25.4) * 203)
-        html_content = f"""
-        <html>
-        <head>
-        {receipt_style}
-        </head>
-        <body>
-            <div class="center">
-                <p>{db_restaurant.name}</p>
-                <p>{db_restaurant.address}</p>
-                <p>{db_restaurant.city}, {db_restaurant.state} {db_restaurant.zip_code}</p>
-            </div>
-            <hr />
-            <hr />
-            <div class="center">
-                <p>Order #{db_order.id}, {order_date}</p>
-            </div>
-            <hr />
-            <hr />
-        """
+        receipt = layout.ReceiptLayout(16)
+        receipt.text(db_restaurant.name, center=True)
+        receipt.text(db_restaurant.address, center=True)
+        receipt.text(f"{db_restaurant.city}, {db_restaurant.state} {db_restaurant.zip_code}", center=True)
+        receipt.rule()
+        receipt.rule()
+        receipt.text(f"Order #{db_order.id}, {order_date}", center=True)
+        receipt.rule()
+        receipt.rule()
         for item in db_order_items:
-            html_content += f"""
-            <div class="item">
-                <span>{item.quantity} × {item.item_name}</span>
-                <span>${item.price:.2f}</span>
-            </div>
-            """
+            receipt.row(f"{item.quantity} × {item.item_name}", f"${item.price:.2f}")
             for config in item.configurations:
-                html_content += f"""
-                <div class="item-details">
-                    <p>{config['label']}: {config['value']}</p>
-                </div>
-                """
-        html_content += f"""
-            <hr />
-            <hr />
-            <div class="item">
-                <span>Subtotal:</span>
-                <span>${(db_transaction.total_amount-db_transaction.collected_tax):.2f}</span>
-            </div>
-            <div class="item">
-                <span>Tax:</span>
-                <span>${db_transaction.collected_tax:.2f}</span>
-            </div>
-            <div class="item">
-                <span>Total:</span>
-                <span>${db_transaction.total_amount:.2f}</span>
-            </div>
-            <hr />
-            <hr />
-        </body>
-        </html>
-        """
-        html_content += f"""
-            <div class="item">
-                <span>Payment Method: {db_transaction.payment_method}</span>
-            </div>
-        """
+                receipt.text(f"{config['label']}: {config['value']}", details=True)
+        receipt.rule()
+        receipt.rule()
+        receipt.row("Subtotal:", f"${(db_transaction.total_amount-db_transaction.collected_tax):.2f}")
+        receipt.row("Tax:", f"${db_transaction.collected_tax:.2f}")
+        receipt.row("Total:", f"${db_transaction.total_amount:.2f}")
+        receipt.rule()
+        receipt.rule()
+        receipt.row(f"Payment Method: {db_transaction.payment_method}")
         if db_transaction.card_paid > 0:
-            html_content += f"""
-            <div class="item">
-                <span>Card Charged:</span>
-                <span>${db_transaction.card_paid:.2f}</span>
-            </div>
-            """
+            receipt.row("Card Charged:", f"${db_transaction.card_paid:.2f}")
             if not (db_transaction.card_paid == db_transaction.total_amount):
-                html_content += f"""
-                <div class="item">
-                    <span>Remaining:</span>
-                    <span>${(db_transaction.total_amount - db_transaction.card_paid):.2f}</span>
-                </div>
-                """
+                receipt.row("Remaining:", f"${(db_transaction.total_amount - db_transaction.card_paid):.2f}")
 
         if db_transaction.cash_paid > 0:
-            html_content += f"""
-            <div class="item">
-                <span>Cash Paid:</span>
-                <span>${db_transaction.cash_paid:.2f}</span>
-            </div>
-            """
+            receipt.row("Cash Paid:", f"${db_transaction.cash_paid:.2f}")
             if not (db_transaction.cash_paid == db_transaction.total_amount):
                 if db_transaction.change_given > 0:
-                    html_content += f"""
-                    <div class="item">
-                        <span>Change Due:</span>
-                        <span>${db_transaction.change_given:.2f}</span>
-                    </div>
-                    """
+                    receipt.row("Change Due:", f"${db_transaction.change_given:.2f}")
                 else:
-                    html_content += f"""
-                    <div class="item">
-                        <span>Card Charged:</span>
-                        <span>${(db_transaction.total_amount - db_transaction.cash_paid):.2f}</span>
-                    </div>
-                    """
+                    receipt.row("Card Charged:", f"${(db_transaction.total_amount - db_transaction.cash_paid):.2f}")
 
-        html_content += f"""
-            <hr />
-            <hr />
-            """
+        receipt.rule()
+        receipt.rule()
 
-        raster_print(html_content, db_printer, res_factor)
+        return raster_print(db, [receipt], db_printer, "receipt", db_order.id)
 
-    return db_order
 
+# Render layouts on the render pool & queue them on the printer's spooler as one job, returns the
+# print job right away. Every raster ends by leaving raster mode, which cuts the paper, so the
+# layouts come out cut apart.
+def raster_print(db: Session, layouts: List[layout.ReceiptLayout], db_printer, kind: str, order_id: Optional[int] = None):
+    return raster_print_all(db, [(db_printer, layouts)], kind, order_id)[0]
 
-def raster_print(content, db_printer, res_factor):
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmpfile:
-        tmpfile_path = tmpfile.name
-        imgkit.from_string(
-            content,
-            tmpfile_path,
-            options={"format": "png", "width": res_factor * 80},
-        )
 
-    with open(tmpfile_path, "rb") as f:
-        img = Image.open(BytesIO(f.read()))
+# Same for several printers, all layouts are rendered side by side and every printer's job is queued
+# in one commit, the spooler's printer workers then print them at the same time
+def raster_print_all(db: Session, printer_layouts: List[Tuple[schemas.Printer, List[layout.ReceiptLayout]]], kind: str, order_id: Optional[int] = None):
+    try:
+        rasters = renderer.render([receipt for _, layouts in printer_layouts for receipt in layouts])
+    except RendererBusy:
+        raise HTTPException(status_code=503, detail="Too many receipts are being printed, try again in a moment")
+    printer_data = []
+    for db_printer, layouts in printer_layouts:
+        printer_data.append((db_printer, b"".join(rasters[: len(layouts)])))
+        rasters = rasters[len(layouts) :]
+    return spooler.submit_all(db, printer_data, kind, order_id)
+
 
-    os.remove(tmpfile_path)
+def get_printer_routes(db: Session):
+    return db.query(models.PrinterRoute).order_by(models.PrinterRoute.id).all()
 
-    raster = StarTSPImage.imageToRaster(img, True)
 
+def create_printer_route(db: Session, route: schemas.PrinterRouteCreate):
+    if (route.category_id is None) == (route.item_id is None):
+        raise HTTPException(status_code=400, detail="A route is for either a category or an item")
+    db_route = models.PrinterRoute(**route.model_dump())
+    db.add(db_route)
     try:
-        # Create a socket connection to the printer
-        with socket.create_connection(
-            (db_printer.ip, db_printer.port), timeout=10
-        ) as sock:
-            # Send raw data in chunks
-            chunk_size = 16384
-            for i in range(0, len(raster), chunk_size):
-                sock.sendall(raster[i : i + chunk_size])
-                time.sleep(0.01)
-        logger.info("Data sent to printer successfully.")
-    except Exception as e:
-        logger.error(f"Failed to send data to printer: {e}")
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Printer, category or item not found")
+    db.refresh(db_route)
+    return db_route
+
+
+def delete_printer_route(db: Session, route_id: int):
+    db_route = db.query(models.PrinterRoute).filter(models.PrinterRoute.id == route_id).first()
+    if db_route is None:
+        return None
+    db.delete(db_route)
+    db.commit()
+    return db_route
+
+
+def get_print_job(db: Session, job_id: int):
+    return db.query(models.PrintJob).filter(models.PrintJob.id == job_id).first()
 
 
+# Queued like a print job, only the process driving the printers may talk to them
 def open_cash_drawer(db: Session):
-    db_printer = db.query(models.Printer).filter(models.Printer.name == "front").first()
+    db_printer = printers.get_printer(db, printers.FRONT_PRINTER)
+    if db_printer is None:
+        raise HTTPException(status_code=404, detail="Printer not found")
     # ESC/POS command to open the cash drawer (ASCII BEL <07h>)
     drawer_command = b"\x07"
-    try:
-        # Create a socket connection to the printer
-        printer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        printer_socket.connect((db_printer.ip, db_printer.port))
-
-        # Send the command to open the cash drawer
-        printer_socket.sendall(drawer_command)
-
-        # Close the connection
-        printer_socket.close()
-        return {"message": "Cash drawer opened successfully"}
-    except Exception as e:
-        return {"error": f"Failed to open cash drawer: {e}"}
+    return spooler.submit(db, db_printer, drawer_command, "drawer")
 
 
 def print_tickets(db: Session, order_id: int, tickets: List[schemas.Ticket]):
-    db_printer = db.query(models.Printer).filter(models.Printer.name == "front").first()
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if db_order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # every line of every ticket in one go
+    order_item_ids = {data.order_item_id for ticket in tickets for data in ticket.root}
+    db_order_items = {
+        db_order_item.id: (db_order_item, item_name, category_id)
+        for db_order_item, item_name, category_id in (
+            db.query(models.OrderItem, models.Item.name, models.Item.category_id)
+            .join(models.Item, models.Item.id == models.OrderItem.item_id)
+            .filter(models.OrderItem.id.in_(order_item_ids), models.OrderItem.order_id == order_id)
+        )
+    }
+    if len(db_order_items) != len(order_item_ids):
+        raise HTTPException(status_code=404, detail="Order item not found")
+
+    # every ticket split up between the stations its lines are routed to, in the order they were given
+    stations: Dict[int, Tuple[schemas.Printer, List[List[schemas.TicketData]]]] = {}
+    for ticket in tickets:
+        station_lines: Dict[int, List[schemas.TicketData]] = {}
+        for data in ticket.root:
+            db_order_item, _, category_id = db_order_items[data.order_item_id]
+            routed = printers.route(db, db_order_item.item_id, category_id)
+            if not routed:
+                raise HTTPException(status_code=404, detail="Printer not found")
+            for db_printer in routed:
+                stations.setdefault(db_printer.id, (db_printer, []))
+                station_lines.setdefault(db_printer.id, []).append(data)
+        for printer_id, lines in station_lines.items():
+            stations[printer_id][1].append(lines)
+
     local_tz = get_localzone()
     localized_order_datetime = pytz.utc.localize(db_order.complete_at).astimezone(
         local_tz
     )
     print_date = datetime.datetime.now(local_tz).strftime("%m/%d/%Y %I:%M %p")
-    ticket_style = get_style(24)
-    for ticket in tickets:
-        res_factor = math.ceil((1 / 25.4) * 203)
-        html_content = f"""
-        <html>
-        <head>
-        {ticket_style}
-        </head>
-        <body>
-        <div class="center" style="margin-top: 400px">
-        """
-        if len(tickets) > 1:
-            html_content += f"""
-            <p>Part of Order #{order_id}, (1/{len(tickets)})</p>
-            """
-        else:
-            html_content += f"""
-            <p>Order #{order_id}</p>
-            """
+    station_layouts = []
+    for db_printer, station_tickets in stations.values():
+        layouts = []
+        for number, lines in enumerate(station_tickets, start=1):
+            ticket_layout = layout.ReceiptLayout(24)
+            ticket_layout.space(400)
+            if len(station_tickets) > 1:
+                ticket_layout.text(f"Part of Order #{order_id}, ({number}/{len(station_tickets)})", center=True)
+            else:
+                ticket_layout.text(f"Order #{order_id}", center=True)
+            ticket_layout.text(f"Printed on {print_date}", center=True, font_size=18)
+            ticket_layout.rule()
+            ticket_layout.rule()
 
-        html_content += f"""
-            <p style="font-size: {18*res_factor}px">Printed on {print_date}</p>
-        </div>
-        """
+            for data in lines:
+                db_order_item, item_name, _ = db_order_items[data.order_item_id]
+                ticket_layout.row(f"{db_order_item.quantity} × {item_name}" + (" ★EAT IN★" if data.eat_in else ""))
+                for config in db_order_item.configurations:
+                    if config["value"]:
+                        ticket_layout.text(f"{config['label']}: {config['value']}", details=True)
+                ticket_layout.rule()
+                ticket_layout.rule()
 
-        html_content += f"<hr /> <hr />"
-        for data in ticket.root:
-            item_name = (
-                db.query(models.Item.name)
-                .join(models.OrderItem, models.Item.id == models.OrderItem.item_id)
-                .filter(models.OrderItem.id == data.order_item_id)
-                .first()[0]
-            )
-            db_order_item = (
-                db.query(models.OrderItem)
-                .filter(models.OrderItem.id == data.order_item_id)
-                .first()
-            )
-            html_content += f"""
-            <div class="item">
-                <span>{db_order_item.quantity} × {item_name}
-            """
-            if data.eat_in:
-                html_content += f"★EAT IN★"
-            html_content += f"</span></div>"
-            for config in db_order_item.configurations:
-                if config["value"]:
-                    html_content += f"""
-                    <div class="item-details">
-                        <p>{config['label']}: {config['value']}</p>
-                    </div>
-                    """
-            html_content += f"<hr /> <hr />"
-
-        html_content += f"""
-        <div class="item">
-            <span>{db_order.customer_name}</span>
-            <span>{localized_order_datetime.strftime("%m/%d/%Y")}</span>
-        </div>
-        <div class="item">
-            <span>{db_order.customer_phone_number}</span>
-            <span>{localized_order_datetime.strftime("%I:%M %p")}</span>
-        </div>
-        """
+            ticket_layout.row(f"{db_order.customer_name}", localized_order_datetime.strftime("%m/%d/%Y"))
+            ticket_layout.row(f"{db_order.customer_phone_number}", localized_order_datetime.strftime("%I:%M %p"))
 
-        raster_print(html_content, db_printer, res_factor)
+            layouts.append(ticket_layout)
+        station_layouts.append((db_printer, layouts))
 
-    return tickets
+    # committed together with the print jobs
+    for db_order_item, _, _ in db_order_items.values():
+        db_order_item.printed = True
+    return raster_print_all(db, station_layouts, "ticket", order_id)
 
 
 def get_order_items(db: Session, order_id: int):
@@ -526,43 +541,42 @@ def update_order_item(
     if any([db_order_item is None, db_item is None]):
         return None
 
+    quantity = db_order_item.quantity if order_item_update.quantity is None else order_item_update.quantity
+    changes = []
+
     # Update configurations, if provided
     if order_item_update.configurations is not None:
-        # reimburse inventory for the item
-        logger.info(f"Reimbursing inventory for order item {db_order_item.id}")
-        evaluate_inventory(db, [db_order_item], 'increment', True)
-        logger.info(f"Old configurations: {db_order_item.configurations}")
+        # price first so a configuration that can't be priced leaves inventory untouched
+        price, taxed = pricing.get_plan(db_item).price(order_item_update.configurations)
+        # reimburse the line under its old configuration & draw it again under the new one, netted below
+        changes += inventory_changes(db, [db_order_item], 'increment', db_order_item.quantity)
         db_order_item.configurations = order_item_update.configurations
-        logger.info(f"Reimbursed inventory for order item {db_order_item.id}")
-        logger.info(f"Updating inventory for order item {db_order_item.id}")
-        logger.info(f"New configurations: {order_item_update.configurations}")
-        # re-decrement inventory for the item
-        evaluate_inventory(db, [db_order_item], 'decrement', True)
-        logger.info(f"Updated inventory for order item {db_order_item.id}")
+        changes += inventory_changes(db, [db_order_item], 'decrement', quantity)
         db_order_item.configurations = cast(db_order_item.configurations, ARRAY(JSONB))
-        price, taxed = calculate_prices(
-            db_item.form_cfg, order_item_update.configurations, db_item.tax_rate
-        )
         db_order_item.price = price
         db_order_item.tax = taxed
+    elif quantity != db_order_item.quantity:
+        changes += inventory_changes(db, [db_order_item], 'decrement', quantity - db_order_item.quantity)
 
     # Update other fields, if provided
     for field in ["quantity", "printed"]:
         if getattr(order_item_update, field) is None: continue
-        if field == "quantity":
-            op = "decrement" if order_item_update.quantity > db_order_item.quantity else "increment"
-            for _ in range(abs(order_item_update.quantity - db_order_item.quantity)):
-                evaluate_inventory(db, [db_order_item], op, True)
         setattr(db_order_item, field, getattr(order_item_update, field))
 
+    write_inventory_changes(db, changes)
+    record_order_event(db, db_order_item.order_id, "item-updated", lambda: order_line_snapshot(db, db_order_item))
     db.commit()
     db.refresh(db_order_item)
     return db_order_item
 
 
 def delete_order_item(db: Session, db_order_item: schemas.OrderItem):
-    evaluate_inventory(db, [db_order_item], 'increment', True)
+    # reimburse the whole line, the movements are flushed before the row they point at goes
+    write_inventory_changes(db, inventory_changes(db, [db_order_item], 'increment', db_order_item.quantity))
+    db.flush()
     db.delete(db_order_item)
+    order_item_id = db_order_item.id
+    record_order_event(db, db_order_item.order_id, "item-deleted", lambda: {"id": order_item_id})
     db.commit()
 
     return db_order_item
@@ -585,224 +599,41 @@ def apply_operator(op, value, base):
         raise ValueError(f"Unsupported operation {op}")
 
 
-def get_dependency_value(depends_on, item_value, configs):
-    # Find the configuration that the current one depends on
-    for _, item_config in configs:
-        if item_config.get("label") == depends_on.get("name"):
-            dependency_options = depends_on.get("values").get(item_value)
-            logger.info(f"Dependency Options: {dependency_options}")
-            for k, v in dependency_options.items():
-                if k == item_config.get("value"):
-                    return float(v)
-    return -1
-
-# example of item form config
-# [
-#     {
-#         "type": "single_select",
-#         "label": "Size",
-#         "order": 0,
-#         "options": [
-#             "#1",
-#             "#2"
-#         ],
-#         "pricing_config": {
-#             "priceBy": "Per Option",
-#             "dependsOn": {
-#                 "name": "",
-#                 "values": {}
-#             },
-#             "isBasePrice": true,
-#             "priceFactor": "+",
-#             "affectsPrice": true,
-#             "constantValue": "0",
-#             "perOptionMapping": {
-#                 "1": "44",
-#                 "2": "25",
-#                 "#1": "40",
-#                 "#2": "32"
-#             }
-#         }
-#     },
-#     {
-#         "type": "single_select",
-#         "label": "Amount Type",
-#         "order": 1,
-#         "options": [
-#             "Bushel",
-#             "Dz",
-#             "Half bushel"
-#         ],
-#         "pricing_config": {
-#             "priceBy": "Dependency",
-#             "dependsOn": {
-#                 "name": "Size",
-#                 "values": {
-#                     "Dz": {
-#                         "#1": "1",
-#                         "#2": "1"
-#                     },
-#                     "Bushel": {
-#                         "#1": "3.18",
-#                         "#2": "0"
-#                     },
-#                     "Half bushel": {
-#                         "#1": "0",
-#                         "#2": "0"
-#                     }
-#                 }
-#             },
-#             "isBasePrice": false,
-#             "priceFactor": "×",
-#             "affectsPrice": true,
-#             "constantValue": "0",
-#             "perOptionMapping": {}
-#         }
-#     },
-#     {
-#         "type": "number",
-#         "label": "Amount",
-#         "order": 2,
-#         "options": [],
-#         "pricing_config": {
-#             "priceBy": "Input",
-#             "dependsOn": {
-#                 "name": "",
-#                 "values": {}
-#             },
-#             "isBasePrice": false,
-#             "priceFactor": "×",
-#             "affectsPrice": true,
-#             "constantValue": "1",
-#             "perOptionMapping": {}
-#         }
-#     },
-#     {
-#         "type": "single_select",
-#         "label": "Spice",
-#         "order": 3,
-#         "options": [
-#             "gar",
-#             "hot",
-#             "reg"
-#         ],
-#         "pricing_config": {
-#             "priceBy": "",
-#             "dependsOn": {
-#                 "name": "",
-#                 "values": {}
-#             },
-#             "isBasePrice": false,
-#             "priceFactor": "",
-#             "affectsPrice": false,
-#             "constantValue": "0",
-#             "perOptionMapping": {}
-#         }
-#     }
-# ]
-
 def calculate_prices(item_config, order_item_config, tax_rate):
-    base_price = 0
-    multipliers = []
-    adders = []
-    selected_values = {}  # To keep track of selected values for dependencies
-    tax_rate = tax_rate / 100
-    # Pair each item configuration with its corresponding form configuration
-    configs = list(zip(item_config, order_item_config))
-
-    # Sort configurations so that multipliers are processed last
-    configs.sort(
-        key=lambda x: (
-            x[0].get("pricing_config", {}).get("priceBy") == "Option Value",
-            x[0].get("pricing_config", {}).get("priceBy")
-            in ("Scaled Option Value", "Dependency"),
-        )
-    )
-
-    for form_config, item_config in configs:
-        logger.info("*" * 50)
-        pricing_config = form_config.get("pricing_config", {})
-        logger.info(f"Processing {form_config.get('label')}")
-        price_by = pricing_config.get("priceBy")
-        is_base_price = pricing_config.get("isBasePrice", False)
-        operator = pricing_config.get(
-            "priceFactor", "+"
-        )  # Defaulting to addition if not specified
-
-        item_value = item_config.get("value", 0)
-        selected_values[form_config.get("label")] = item_value
-        logger.info(f"Item value is {item_value}")
-
-        if price_by in ("Constant", "Input"):
-            value = float(pricing_config.get("constantValue", 0))
-            logger.info(f"'Price by' is constant or input with value {value}")
-            if is_base_price:
-                base_price = apply_operator(operator, value, base_price)
-                logger.info(f"Base price is now {base_price}")
-            else:
-                logger.info("Item is not base price")
-                if operator == "+":
-                    adders.append(value)
-                    logger.info("Operator is +, adding to adders")
-                else:
-                    multipliers.append(value)
-                    logger.info("Operator is x, adding to multipliers")
-        elif price_by == "Per Option":
-            logger.info("'Price by' is per option")
-            value = float(pricing_config.get("perOptionMapping", {}).get(item_value, 0))
-            logger.info(f"Item value {item_value} maps to {value}")
-            if is_base_price:
-                base_price = apply_operator(operator, value, base_price)
-                logger.info(f"Item is base price, base price is now {base_price}")
-            else:
-                logger.info(f"Item is not base price, adding {value} to adders")
-                adders.append(value)
-        elif price_by == "Option Value":
-            value = float(item_value)
-            multipliers.append(value)
-            logger.info(f"'Price by' is option value, adding {value} to multipliers")
-        elif price_by == "Scaled Option Value":
-            value = float(pricing_config.get("constantValue", 0)) * float(item_value)
-            multipliers.append(value)
-            logger.info(f"'Price by' is scaled option value, adding {value} to multipliers")
-        elif price_by == "Dependency":
-            value = get_dependency_value(
-                pricing_config["dependsOn"], item_value, configs
-            )
-            logger.info(f"'Price by' is dependency")
-            if operator == "+":
-                logger.info(f"Operator is +, adding {value} to adders")
-                adders.append(value)
-            else:
-                logger.info(f"Operator is x, adding {value} to multipliers")
-                multipliers.append(value)
-
-    logger.info("*" * 50)
-    # Sum all additions first
-    final_price = base_price
-    logger.info(f"Base price before modifiers: {base_price}")
-
-    # Apply all multipliers sequentially
-    for multiplier in multipliers:
-        final_price *= multiplier
-        logger.info(f"Applying multiplier {multiplier}, final price is now {final_price}")
-
-    final_price += sum(adders)
-    logger.info(f"Adding all adders ({sum(adders)} in total), final price is now {final_price}")
-    final_price += final_price * tax_rate
-    logger.info(f"Adding tax ({final_price * tax_rate}), final price is now {final_price}")
-
-    # return total price w/ tax & tax amount
-    return (round(max(0, final_price), 2), round(final_price * tax_rate, 2))
-
+    return pricing.PricingPlan(item_config, tax_rate).price(order_item_config)
 
 
 # Check item price based on its configurations
-def check_item_price(db: Session, item_id: int, configurations: list):
+def check_item_price(db: Session, item_id: int, configurations: list, explain: bool = False):
     db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if db_item:
-        return calculate_prices(db_item.form_cfg, configurations, db_item.tax_rate)[0]
-    return 0
+    if not db_item:
+        return 0
+    plan = pricing.get_plan(db_item)
+    if explain:
+        trace = []
+        price, tax = plan.finalize(*plan.collect(configurations, trace), trace)
+        return schemas.PriceExplanation(price=price, tax=tax, trace=trace)
+    return plan.price(configurations)[0]
+
+
+# Price many (item, configurations) pairs at once, loading every item involved in one query
+def check_item_prices(db: Session, quotes: List[schemas.PriceQuote]):
+    item_ids = {quote.item_id for quote in quotes}
+    db_items = db.query(models.Item).filter(models.Item.id.in_(item_ids)).all() if item_ids else []
+    item_plans = {db_item.id: pricing.get_plan(db_item) for db_item in db_items}
+
+    results = [schemas.PriceQuoteResult(item_id=quote.item_id) for quote in quotes]
+    for result, quote in zip(results, quotes):
+        plan = item_plans.get(quote.item_id)
+        if plan is None:
+            result.error = "Item not found"
+            continue
+        try:
+            result.price, result.tax = plan.price(quote.configurations)
+        except (pricing.PricingError, ValueError) as e:
+            result.error = str(e)
+
+    return results
 
 
 def get_reports(db: Session):
@@ -874,12 +705,222 @@ def get_reports(db: Session):
 from pydantic import TypeAdapter
 inventory_config_adapter = TypeAdapter(schemas.InventoryConfig)
 
+# parsed inventory configs by item id, each tagged with the item version it was parsed from
+inventory_configs: Dict[int, Tuple[int, schemas.InventoryConfig]] = {}
+
+
+# Parsed inventory config of an item row (anything with id, version & inventory_config), only
+# validated again when the item's version changes. Treat the result as read only.
+def get_inventory_config(db_item) -> schemas.InventoryConfig:
+    cached = inventory_configs.get(db_item.id)
+    if cached is None or cached[0] != db_item.version:
+        cached = (db_item.version, inventory_config_adapter.validate_python(db_item.inventory_config))
+        inventory_configs[db_item.id] = cached
+    return cached[1]
+
+# Inventory amounts live in the inventory_balances table, one row per item & bucket, and every change
+# to them is recorded in inventory_movements. The amounts in Item.inventory_config are only the
+# stock an admin last set, see sync_inventory_balances.
+
+def format_inventory_amounts(amounts):
+    return {bucket: str(amount) for bucket, amount in amounts.items()}
+
+
+# Stock that isn't reserved by a pending order
+available_inventory = func.round(cast(models.InventoryBalance.amount - models.InventoryBalance.reserved, Numeric), 2).cast(Float)
+
+
+# Current available balances of the given items, {item_id: {bucket: amount}}
+def get_inventory_balances(db: Session, item_ids):
+    balances = {}
+    rows = (
+        db.query(models.InventoryBalance.item_id, models.InventoryBalance.bucket, available_inventory.label("amount"))
+        .filter(models.InventoryBalance.item_id.in_(item_ids))
+        .all()
+    ) if item_ids else []
+    for row in rows:
+        balances.setdefault(row.item_id, {})[row.bucket] = row.amount
+    return balances
+
+
+# Apply deltas to a balance's stock & reservations in one atomic UPDATE, returning what's now available
+def apply_inventory_delta(db: Session, item_id: int, bucket: str, delta: float, reserved_delta: float = 0):
+    balance = db.execute(
+        update(models.InventoryBalance)
+        .where(models.InventoryBalance.item_id == item_id, models.InventoryBalance.bucket == bucket)
+        .values(
+            amount=func.round(cast(models.InventoryBalance.amount + delta, Numeric), 2),
+            reserved=func.round(cast(models.InventoryBalance.reserved + reserved_delta, Numeric), 2),
+            version=models.InventoryBalance.version + 1,
+        )
+        .returning(available_inventory, models.InventoryBalance.version)
+    ).one_or_none()
+    if balance is None:
+        raise ValueError(f'Item {item_id} has no inventory for "{bucket}"')
+    record_inventory_update(db, item_id, bucket, *balance)
+    return balance[0]
+
+
+# Terminals keep a live view of stock from inventory-delta messages, published once the transaction
+# that changed the balances commits. Updates are coalesced per item, so however many lines an order
+# has there's one message per item, carrying the latest amount & version of each bucket it touched.
+# A bucket removed from an item is sent with an amount of null.
+def record_inventory_update(db: Session, item_id: int, bucket: str, amount: Optional[float], version: int):
+    db.info.setdefault("inventory_updates", {}).setdefault(item_id, {})[bucket] = (amount, version)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_inventory_updates(db: Session):
+    for item_id, buckets in db.info.pop("inventory_updates", {}).items():
+        realtime.manager.publish({
+            "type": "inventory-delta",
+            "payload": {
+                "item_id": item_id,
+                "buckets": [
+                    {"bucket": bucket, "amount": None if amount is None else str(amount), "version": version}
+                    for bucket, (amount, version) in buckets.items()
+                ],
+            },
+        })
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_inventory_updates(db: Session):
+    db.info.pop("inventory_updates", None)
+
+
+# Held stock of pending orders, {orders} is a query of their ids. Deleting the reservations hands back
+# the sum held per balance, {settle} is what else happens to the balance besides reserved going down:
+# releasing makes the stock available again, so the version moves on for terminals to be told, while
+# settling also takes it from amount (& records it in the ledger), which leaves available as it was.
+SETTLE_RESERVATIONS = """
+    settled AS (
+        DELETE FROM inventory_reservations WHERE order_id IN ({orders})
+        RETURNING order_item_id, item_id, bucket, amount
+    ),
+    settled_totals AS (
+        SELECT item_id, bucket, sum(amount) AS amount FROM settled GROUP BY item_id, bucket
+    ),
+    settled_balances AS (
+        UPDATE inventory_balances b
+        SET reserved = round((b.reserved - t.amount)::numeric, 2), {settle}
+        FROM settled_totals t
+        WHERE b.item_id = t.item_id AND b.bucket = t.bucket
+        RETURNING b.item_id, b.bucket, round((b.amount - b.reserved)::numeric, 2)::float AS amount, b.version
+    )
+"""
+RELEASED_BALANCE = "version = b.version + 1"
+SETTLED_BALANCE = "amount = round((b.amount - t.amount)::numeric, 2)"
+
+
+# Release the stock held by a pending order, e.g. when it's deleted
+def release_reservations(db: Session, order_id: int):
+    released = db.execute(text(
+        "WITH" + SETTLE_RESERVATIONS.format(orders=":order_id", settle=RELEASED_BALANCE)
+        + "SELECT item_id, bucket, amount, version FROM settled_balances"
+    ), {"order_id": order_id})
+    for balance in released:
+        record_inventory_update(db, *balance)
+
+
+# Make the stock held by an order final when it's submitted
+def settle_reservations(db: Session, order_id: int):
+    db.execute(text(
+        "WITH" + SETTLE_RESERVATIONS.format(orders=":order_id", settle=SETTLED_BALANCE) + """
+        INSERT INTO inventory_movements (item_id, bucket, delta, order_item_id, reason)
+        SELECT item_id, bucket, -amount, order_item_id, CASE WHEN amount > 0 THEN 'decrement' ELSE 'increment' END
+        FROM settled WHERE amount <> 0
+    """), {"order_id": order_id})
+
+
+# Bring an item's balances in line with the amounts set in its inventory config, recording the
+# difference as an adjustment. Called whenever an admin saves the item.
+def sync_inventory_balances(db: Session, db_item: models.Item):
+    inventory_config = inventory_config_adapter.validate_python(db_item.inventory_config)
+    if not inventory_config.manageItemInventory:
+        return
+    # the admin sees & sets available stock, whatever pending orders hold stays reserved on top of it
+    configured = {bucket: round(float(amount), 2) for bucket, amount in inventory_config.dependsOn.amounts.items()}
+    balances = {
+        row.bucket: row
+        for row in db.query(models.InventoryBalance).filter(models.InventoryBalance.item_id == db_item.id).with_for_update()
+    }
+    for bucket in balances.keys() - configured.keys():
+        db.add(models.InventoryMovement(item_id=db_item.id, bucket=bucket, delta=-balances[bucket].amount, reason="adjustment"))
+        db.delete(balances[bucket])
+        record_inventory_update(db, db_item.id, bucket, None, balances[bucket].version + 1)
+    for bucket, amount in configured.items():
+        balance = balances.get(bucket)
+        created = balance is None
+        if created:
+            balance = models.InventoryBalance(item_id=db_item.id, bucket=bucket, amount=0.0, reserved=0.0, version=0)
+            db.add(balance)
+        delta = round(amount - (balance.amount - balance.reserved), 2)
+        if delta != 0:
+            db.add(models.InventoryMovement(item_id=db_item.id, bucket=bucket, delta=delta, reason="adjustment"))
+            balance.amount = round(balance.amount + delta, 2)
+        if delta != 0 or created:
+            balance.version += 1
+            record_inventory_update(db, db_item.id, bucket, amount, balance.version)
+
+
+# An item is sold out once every one of its inventory buckets has run dry
+def is_sold_out(amounts):
+    return all(amount <= 0 for amount in amounts.values())
+
+
+# Overlay current balances on the amounts of serialized items' inventory configs, optionally
+# flagging managed items as sold out
+def with_inventory_balances(db: Session, items: List[schemas.Item], flag_sold_out: bool = False):
+    balances = get_inventory_balances(db, [item.id for item in items])
+    for item in items:
+        if item.id not in balances:
+            continue
+        if isinstance(item.inventory_config, schemas.InventoryConfig):
+            item.inventory_config.dependsOn.amounts = format_inventory_amounts(balances[item.id])
+            managed = item.inventory_config.manageItemInventory
+        elif isinstance(item.inventory_config.get("dependsOn"), dict):
+            item.inventory_config = {
+                **item.inventory_config,
+                "dependsOn": {**item.inventory_config["dependsOn"], "amounts": format_inventory_amounts(balances[item.id])},
+            }
+            managed = item.inventory_config.get("manageItemInventory", False)
+        else:
+            continue
+        if flag_sold_out and managed:
+            item.sold_out = is_sold_out(balances[item.id])
+    return items
+
+
 def get_available_inventory(db: Session, item_id: int):
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    item = db.query(models.Item.id, models.Item.version, models.Item.inventory_config).filter(models.Item.id == item_id).first()
     if not item: return None
-    inventory_config = inventory_config_adapter.validate_python(item.inventory_config)
-    if not inventory_config.manageItemInventory: return None
-    return inventory_config.dependsOn.amounts
+    if not get_inventory_config(item).manageItemInventory: return None
+    return format_inventory_amounts(get_inventory_balances(db, [item_id]).get(item_id, {}))
+
+
+# Availability of every managed item in one query, {item_id: {"amounts": {bucket: amount}, "sold_out": bool}}
+def get_all_available_inventory(db: Session):
+    rows = (
+        db.query(
+            models.Item.id,
+            models.Item.version,
+            models.Item.inventory_config,
+            models.InventoryBalance.bucket,
+            available_inventory.label("amount"),
+        )
+        .join(models.InventoryBalance, models.InventoryBalance.item_id == models.Item.id)
+        .order_by(models.Item.id, models.InventoryBalance.bucket)
+        .all()
+    )
+    balances = {}
+    for row in rows:
+        if not get_inventory_config(row).manageItemInventory: continue
+        balances.setdefault(row.id, {})[row.bucket] = row.amount
+    return {
+        item_id: {"amounts": format_inventory_amounts(amounts), "sold_out": is_sold_out(amounts)}
+        for item_id, amounts in balances.items()
+    }
 
 def edit_inventory(db: Session, order_id: Optional[int] = None, order_item_id: Optional[int] = None, operation: str = 'decrement', commit: bool = False):
     assert operation in ['decrement', 'increment'], 'Operation must be either decrement or increment'
@@ -892,72 +933,189 @@ def edit_inventory(db: Session, order_id: Optional[int] = None, order_item_id: O
     # Decrement or increment the inventory item(s) based on the operation
     return evaluate_inventory(db, order_items, operation, commit)
 
-def check_inventory_impact(db: Session, order_item_config: schemas.OrderItemConfig):
+def check_inventory_impact(db: Session, order_item_config: schemas.OrderItemConfig, explain: bool = False):
+    trace = [] if explain else None
     # since this isn't a real order item & we have not provided a fake order item id, the results will be returned with a key of -1
-    return evaluate_inventory(db, [order_item_config], 'decrement', False)[-1]
-
-def evaluate_inventory(db, order_items, operation, commit):
-    updated_configs = {}
+    amounts = evaluate_inventory(db, [order_item_config], 'decrement', False, trace)[-1]
+    if explain:
+        return {"amounts": amounts, "trace": trace}
+    return amounts
+
+# Work out which inventory bucket (value of the dependsOn field) an order item draws from and by how much
+def inventory_change(inventory_config: schemas.InventoryConfig, configurations: List[dict], trace: Optional[list] = None):
+    amount = 1
+    bucket = ''
+    decrementDependsOnValues = [None, None]
+
+    for comp in configurations:
+        if comp["label"] == inventory_config.decrementer:
+            amount = float(comp["value"])
+        if comp["label"] == inventory_config.dependsOn.name:
+            bucket = comp["value"]
+        if comp["label"] in inventory_config.decrementDependsOn.names:
+            index = inventory_config.decrementDependsOn.names.index(comp["label"])
+            decrementDependsOnValues.insert(index, comp["value"])
+
+    decrementMultipler = None
+    if decrementDependsOnValues[0]:
+        decrementMultipler = inventory_config.decrementDependsOn.amounts[decrementDependsOnValues[0]]
+
+        if decrementDependsOnValues[1]:
+            decrementMultipler = decrementMultipler[decrementDependsOnValues[1]]
+
+    if trace is not None:
+        trace.append({
+            "bucket": bucket,
+            "decrementer": inventory_config.decrementer,
+            "decrement_amount": amount,
+            "decrement_depends_on": [value for value in decrementDependsOnValues if value is not None],
+            "decrement_multiplier": decrementMultipler,
+        })
+
+    if decrementMultipler is not None:
+        amount *= float(decrementMultipler)
+
+    return bucket, amount
+
+
+# Signed inventory changes of order items, as (order_item, item_id, bucket, delta, item_trace).
+# multiplier scales the per-unit change, e.g. by a whole line's quantity or a quantity difference.
+# All items are loaded in one query.
+def inventory_changes(db, order_items, operation, multiplier=1, trace: Optional[list] = None):
+    item_ids = {order_item.item_id for order_item in order_items}
+    items = {item.id: item for item in db.query(models.Item).filter(models.Item.id.in_(item_ids))} if item_ids else {}
+
+    changes = []
     for order_item in order_items:
-        item = db.query(models.Item).filter(models.Item.id == order_item.item_id).first()
-        inventory_config = inventory_config_adapter.validate_python(item.inventory_config)
+        item = items.get(order_item.item_id)
+        if item is None:
+            raise ValueError(f"Item {order_item.item_id} not found")
+        inventory_config = get_inventory_config(item)
 
         if not inventory_config.manageItemInventory: continue
 
-        if inventory_config.dependsOn == 'none' and inventory_config.decrementer == '1_per_order': 
-            inventory_config.dependsOn.amounts[''] = apply_operator(operation, 1, inventory_config.dependsOn.amounts[''])
-        
+        item_trace = [] if trace is not None else None
+        bucket, amount = inventory_change(inventory_config, order_item.configurations, item_trace)
+        changes.append((order_item, item.id, bucket, apply_operator(operation, amount * multiplier, 0), item_trace))
+    return changes
+
+
+# Work changes through the current balances, this is also the projection when not committing
+def project_inventory(db, changes, trace: Optional[list] = None):
+    amounts = get_inventory_balances(db, list({item_id for _, item_id, _, _, _ in changes}))
+    for order_item, item_id, bucket, delta, item_trace in changes:
+        item_amounts = amounts.get(item_id, {})
+        if bucket not in item_amounts:
+            raise ValueError(f'Item {item_id} has no inventory for "{bucket}"')
+        available = item_amounts[bucket]
+        item_amounts[bucket] = round(available + delta, 2)
+
+        if trace is not None:
+            trace.append({
+                "order_item_id": getattr(order_item, 'id', None) or -1,
+                "item_id": item_id,
+                **item_trace[0],
+                "operation": "decrement" if delta < 0 else "increment",
+                "amount": abs(delta),
+                "available": available,
+                "new_amount": str(item_amounts[bucket]),
+            })
+    return amounts
+
+
+# Apply changes without committing. Changes to order items of pending orders only reserve stock, the
+# rest move it for good. Deltas to the same balance are combined into one UPDATE and the balances are
+# updated in a fixed (item, bucket) order so concurrent evaluations lock rows in the same order and
+# can't deadlock. The ledger still gets one netted movement per order item & bucket.
+def write_inventory_changes(db, changes):
+    movements = {}
+    for order_item, item_id, bucket, delta, _ in changes:
+        key = (item_id, bucket, getattr(order_item, 'id', None))
+        movements[key] = movements.get(key, 0) + delta
+    movements = {key: round(delta, 2) for key, delta in movements.items() if round(delta, 2) != 0}
+
+    order_item_ids = {order_item_id for _, _, order_item_id in movements if order_item_id is not None}
+    pending = dict(
+        db.query(models.OrderItem.id, models.OrderItem.order_id)
+        .join(models.Order, models.Order.id == models.OrderItem.order_id)
+        .filter(models.OrderItem.id.in_(order_item_ids), models.Order.status == "pending")
+        .all()
+    ) if order_item_ids else {}
+
+    balances = {}
+    for (item_id, bucket, order_item_id), delta in movements.items():
+        taken, reserved = balances.get((item_id, bucket), (0, 0))
+        if order_item_id in pending:
+            balances[(item_id, bucket)] = (taken, reserved - delta)
         else:
-            amount = 1
-            dependsOn = ''
-            decrementDependsOnValues = [None, None]
-
-            logger.info(f"OLD INVENTORY AMOUNTS: {inventory_config.dependsOn.amounts}")
-
-            for comp in order_item.configurations:
-                logger.info(f'this comp was fine {comp}')
-                if comp["label"] == inventory_config.decrementer:
-                    amount = float(comp["value"])
-                    logger.info(f"Found decrementer of {amount} from {comp['label']}")
-                if comp["label"] == inventory_config.dependsOn.name:
-                    dependsOn = comp["value"]
-                    logger.info(f"Inventory depends on {comp['label']} with user-selected value of {comp['value']}")
-                if comp["label"] in inventory_config.decrementDependsOn.names:
-                    index = inventory_config.decrementDependsOn.names.index(comp["label"])
-                    decrementDependsOnValues.insert(index, comp["value"])
-                    logger.info(f"Found decrement dependency value {comp['value']} from {comp['label']}")
-            logger.info('i made it here')
-            available = float(inventory_config.dependsOn.amounts[dependsOn])
-
-            if decrementDependsOnValues[0]:
-                decrementMultipler = inventory_config.decrementDependsOn.amounts[decrementDependsOnValues[0]]
-                    
-                if decrementDependsOnValues[1]:
-                    decrementMultipler = decrementMultipler[decrementDependsOnValues[1]]
-                
-                logger.info(f"Adjusted decrement multiplier to {decrementMultipler} based on decrement dependencies")
-
-                amount *= float(decrementMultipler)
-            
-        inventory_config.dependsOn.amounts[dependsOn] = str(round(apply_operator(operation, amount, available),2))
-        updated_configs[getattr(order_item, 'id', -1)] = inventory_config.dependsOn.amounts
-
-        if commit:
-            item.inventory_config = inventory_config.model_dump()
+            balances[(item_id, bucket)] = (taken + delta, reserved)
+
+    for (item_id, bucket), (taken, reserved) in sorted(balances.items()):
+        apply_inventory_delta(db, item_id, bucket, round(taken, 2), round(reserved, 2))
+    reservations = []
+    for (item_id, bucket, order_item_id), delta in movements.items():
+        if order_item_id in pending:
+            reservations.append(dict(order_item_id=order_item_id, item_id=item_id, bucket=bucket, order_id=pending[order_item_id], amount=-delta))
+        else:
+            db.add(models.InventoryMovement(
+                item_id=item_id, bucket=bucket, delta=delta, reason="decrement" if delta < 0 else "increment", order_item_id=order_item_id
+            ))
+    if reservations:
+        statement = insert(models.InventoryReservation).values(reservations)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["order_item_id", "item_id", "bucket"],
+            set_={"amount": func.round(cast(models.InventoryReservation.amount + statement.excluded.amount, Numeric), 2)},
+        ))
+
+
+def evaluate_inventory(db, order_items, operation, commit, trace: Optional[list] = None):
+    changes = inventory_changes(db, order_items, operation, trace=trace)
+    amounts = project_inventory(db, changes, trace)
+
+    if commit:
+        # everything is committed at once, so an order's inventory is either fully applied or not at all
+        try:
+            write_inventory_changes(db, changes)
             db.commit()
-            db.refresh(item)
-        
-        logger.info(f'{operation} {dependsOn} by: {amount}')
-        logger.info(f'NEW INVENTORY AMOUNTS: {inventory_config.dependsOn.amounts}')
+        except Exception:
+            db.rollback()
+            raise
+        amounts = get_inventory_balances(db, list(amounts))
+
+    return {
+        getattr(order_item, 'id', None) or -1: format_inventory_amounts(amounts[item_id])
+        for order_item, item_id, _, _, _ in changes
+    }
 
-    return updated_configs                
+# how long a pending order holds its stock after it was last touched
+RESERVATION_TTL = datetime.timedelta(minutes=10)
 
+
+# Purge pending orders that haven't been interacted with within the reservation TTL and release the
+# stock they held, all in one statement
 def cleanup_orders(db: Session):
-    ten_minutes_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=10)
-    # Get all orders that have been pending for more than 10 minutes
-    orders = db.query(models.Order).filter(models.Order.status == "pending", models.Order.last_interacted_at < ten_minutes_ago).all()
-    logger.info(f"Purging {len(orders)} pending orders that have not been interacted with in 10 minutes. . .")
-    for order in orders:
-        db.delete(order)
+    expires_before = datetime.datetime.now(datetime.timezone.utc) - RESERVATION_TTL
+    # always one row for the ids purged, plus the balances the released stock went back to
+    rows = db.execute(text(
+        """
+        WITH expired AS (
+            SELECT id FROM orders WHERE status = 'pending' AND last_interacted_at < :expires_before
+            FOR UPDATE SKIP LOCKED
+        ),"""
+        + SETTLE_RESERVATIONS.format(orders="SELECT id FROM expired", settle=RELEASED_BALANCE)
+        + """,
+        purged AS (
+            DELETE FROM orders WHERE id IN (SELECT id FROM expired) RETURNING id
+        )
+        SELECT (SELECT array_agg(id) FROM purged) AS purged, b.item_id, b.bucket, b.amount, b.version
+        FROM (SELECT 1) AS one LEFT JOIN settled_balances b ON true
+        """
+    ), {"expires_before": expires_before}).all()
+    purged = rows[0].purged or []
+    for row in rows:
+        if row.item_id is not None:
+            record_inventory_update(db, row.item_id, row.bucket, row.amount, row.version)
+    for order_id in purged:
+        record_order_event(db, order_id, "expired")
     db.commit()
-
+    logger.info(f"Purged {len(purged)} pending orders that have not been interacted with in {RESERVATION_TTL}")
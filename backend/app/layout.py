@@ -0,0 +1,180 @@
+import math, os
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+# Draws receipts & tickets straight to a 1-bit image the width of the printer's raster. The layout
+# mirrors the HTML/CSS the receipts used to be rendered from with wkhtmltoimage: the page was
+# 80mm * res_factor wide in CSS units and scaled down to the printer's dots, so every size below is
+# given in the same CSS px it had there and converted with SCALE.
+
+# Star TSP raster, 72 bytes per line at 203 dpi
+WIDTH = 72 * 8
+RES_FACTOR = math.ceil((1 / 25.4) * 203)
+CSS_PX_PER_MM = 96 / 25.4
+SCALE = WIDTH / (80 * RES_FACTOR * CSS_PX_PER_MM)
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), "fonts", "DejaVuSans.ttf")
+
+# p, span { margin: 2*res_factor px 0 }
+TEXT_MARGIN = 2 * RES_FACTOR
+# hr { border-top: res_factor px }, with the default hr margin of 0.5em of the 16px body font
+RULE_THICKNESS = RES_FACTOR
+RULE_MARGIN = 8
+# .item-details { padding-left: font_size * 0.4226 * res_factor mm }
+DETAILS_INDENT_PER_FONT_PX = 0.4226 * RES_FACTOR * CSS_PX_PER_MM
+
+BLACK = 0
+WHITE = 1
+
+
+def dots(css_px: float) -> int:
+    return round(css_px * SCALE)
+
+
+@lru_cache(maxsize=None)
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+def line_height(font: ImageFont.FreeTypeFont) -> int:
+    ascent, descent = font.getmetrics()
+    return ascent + descent
+
+
+# Break text into lines that fit in width, on spaces where possible
+def wrap(text: str, font: ImageFont.FreeTypeFont, width: int) -> List[str]:
+    lines = []
+    line = ""
+    for word in text.split(" "):
+        candidate = f"{line} {word}" if line else word
+        if font.getlength(candidate) <= width or not line:
+            line = candidate
+        else:
+            lines.append(line)
+            line = word
+        # a single word wider than the line is broken wherever it overflows
+        while font.getlength(line) > width and len(line) > 1:
+            cut = len(line) - 1
+            while cut > 1 and font.getlength(line[:cut]) > width:
+                cut -= 1
+            lines.append(line[:cut])
+            line = line[cut:]
+    lines.append(line)
+    return lines
+
+
+# Lays out & draws the blocks of a receipt, fonts & all
+class Page:
+    def __init__(self, font_size: int):
+        self.font = get_font(dots(font_size * RES_FACTOR))
+        self.details_indent = dots(font_size * DETAILS_INDENT_PER_FONT_PX)
+        # (kind, margin, content) blocks laid out top to bottom, margins of paragraphs & rules collapse
+        # into each other like they did in CSS while the flex rows of .item keep theirs
+        self.blocks: List[Tuple[str, int, object]] = []
+
+    # <p>, optionally centered, indented like .item-details or at another font size
+    def text(self, text: str, center: bool = False, details: bool = False, font_size: Optional[int] = None):
+        font = get_font(dots(font_size * RES_FACTOR)) if font_size else self.font
+        indent = self.details_indent if details else 0
+        lines = wrap(str(text), font, WIDTH - indent)
+        self.blocks.append(("text", dots(TEXT_MARGIN), (lines, font, center, indent)))
+
+    # <div class="item"> of a left & right aligned span
+    def row(self, left: str, right: str = ""):
+        right_width = math.ceil(self.font.getlength(right))
+        lines = wrap(str(left), self.font, WIDTH - right_width)
+        self.blocks.append(("row", 0, (lines, right)))
+
+    # <hr />
+    def rule(self):
+        self.blocks.append(("rule", dots(RULE_MARGIN), None))
+
+    # an empty block with only a (collapsing) margin, like style="margin-top: ..."
+    def space(self, css_px: float):
+        self.blocks.append(("space", dots(css_px), None))
+
+    def height(self, block) -> int:
+        kind, _, content = block
+        if kind == "text":
+            lines, font, _, _ = content
+            return len(lines) * line_height(font)
+        if kind == "row":
+            lines, _ = content
+            return 2 * dots(TEXT_MARGIN) + len(lines) * line_height(self.font)
+        if kind == "rule":
+            return max(1, dots(RULE_THICKNESS))
+        return 0
+
+    # y of every block & the page height, with adjoining margins collapsed to the largest of them
+    def flow(self) -> Tuple[List[int], int]:
+        positions = []
+        y = 0
+        margin = 0
+        for block in self.blocks:
+            block_margin = block[1]
+            y += max(margin, block_margin)
+            positions.append(y)
+            y += self.height(block)
+            margin = block_margin if block[0] != "row" else 0
+        return positions, y + margin
+
+    def render(self) -> Image.Image:
+        positions, height = self.flow()
+        image = Image.new("1", (WIDTH, max(1, height)), WHITE)
+        draw = ImageDraw.Draw(image)
+        for (kind, _, content), y in zip(self.blocks, positions):
+            if kind == "text":
+                lines, font, center, indent = content
+                for line in lines:
+                    x = (WIDTH - font.getlength(line)) / 2 if center else indent
+                    draw.text((x, y), line, font=font, fill=BLACK)
+                    y += line_height(font)
+            elif kind == "row":
+                lines, right = content
+                y += dots(TEXT_MARGIN)
+                draw.text((WIDTH - self.font.getlength(right), y), right, font=self.font, fill=BLACK)
+                for line in lines:
+                    draw.text((0, y), line, font=self.font, fill=BLACK)
+                    y += line_height(self.font)
+            elif kind == "rule":
+                draw.rectangle((0, y, WIDTH - 1, y + self.height((kind, 0, None)) - 1), fill=BLACK)
+        return image
+
+
+# What goes on a receipt, in order. Only the calls are kept, the fonts & text wrapping are worked out
+# by the Page they're replayed onto, so a layout is cheap to build & can be pickled over to a render
+# process.
+class ReceiptLayout:
+    # font_size is the same base size get_style took, in CSS px before res_factor
+    def __init__(self, font_size: int):
+        self.font_size = font_size
+        self.calls: List[Tuple[str, tuple]] = []
+
+    # <p>, optionally centered, indented like .item-details or at another font size
+    def text(self, text: str, center: bool = False, details: bool = False, font_size: Optional[int] = None):
+        self.calls.append(("text", (str(text), center, details, font_size)))
+
+    # <div class="item"> of a left & right aligned span
+    def row(self, left: str, right: str = ""):
+        self.calls.append(("row", (str(left), str(right))))
+
+    # <hr />
+    def rule(self):
+        self.calls.append(("rule", ()))
+
+    # an empty block with only a (collapsing) margin, like style="margin-top: ..."
+    def space(self, css_px: float):
+        self.calls.append(("space", (css_px,)))
+
+    def page(self) -> Page:
+        page = Page(self.font_size)
+        for name, args in self.calls:
+            getattr(page, name)(*args)
+        return page
+
+    def flow(self) -> Tuple[List[int], int]:
+        return self.page().flow()
+
+    def render(self) -> Image.Image:
+        return self.page().render()
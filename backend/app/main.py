@@ -3,7 +3,10 @@ from sqlalchemy.orm import Session
 import logging, json
 from typing import List, Dict, Union
 
-import crud, models, schemas, auth
+import crud, models, schemas, auth, pricing
+from realtime import manager
+from renderer import renderer
+from spooler import spooler
 from database import engine, get_db, SessionLocal
 from typing import Annotated, Optional
 from fastapi.security import OAuth2PasswordRequestForm
@@ -23,39 +26,28 @@ models.Base.metadata.create_all(bind=engine)
 # Logger setup
 logger = logging.getLogger(__name__)
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, data: str, sender: WebSocket = None):
-        for connection in self.active_connections:
-            if connection != sender:
-                await connection.send_text(data)
-
-manager = ConnectionManager()
-
 async def order_cleanup_task():
     while True:
         db = SessionLocal()
         try:
             crud.cleanup_orders(db)
+            crud.prune_order_events(db)
         finally:
             db.close()
-        await asyncio.sleep(600)
+        # expired orders keep their stock reserved until they're purged, so check every minute
+        await asyncio.sleep(60)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    manager.start(asyncio.get_running_loop())
+    renderer.start()
+    spooler.start()
     task = asyncio.create_task(order_cleanup_task())
     yield
     task.cancel()
+    spooler.stop()
+    renderer.stop()
+    manager.stop()
     try:
         await task
     except asyncio.CancelledError:
@@ -72,18 +64,22 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.broadcast(data, sender=websocket)
+            manager.receive(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        await manager.broadcast(json.dumps({"message": "Device disconnected"}))
+        pass
+    except RuntimeError:
+        # the manager dropped a client that fell behind and closed its socket
+        if websocket in manager.active_connections:
+            raise
+    manager.disconnect(websocket)
+    manager.send(json.dumps({"message": "Device disconnected"}))
 
 @user_router.get("/items/", response_model=List[schemas.Item])
 def read_items(db: Session = Depends(get_db)):
     items = crud.get_items(db)
     if not items:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No items found")
-    return items
+    return crud.with_inventory_balances(db, [schemas.Item.model_validate(item) for item in items])
 
 @admin_router.post("/items/create/", response_model=schemas.Item)
 def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db)):
@@ -107,13 +103,24 @@ def delete_item(item_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Item not found")
     return crud.delete_item(db=db, db_item=db_item)
 
-@user_router.post("/items/{item_id}/check_price", response_model=float)
-def check_price(item_id: int, configurations: List[Dict], db: Session = Depends(get_db)):
-    price = crud.check_item_price(db, item_id=item_id, configurations=configurations)
+@user_router.post("/items/{item_id}/check_price", response_model=Union[float, schemas.PriceExplanation])
+def check_price(item_id: int, configurations: List[Dict], explain: bool = False, db: Session = Depends(get_db)):
+    try:
+        price = crud.check_item_price(db, item_id=item_id, configurations=configurations, explain=explain)
+    except pricing.PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if price is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return price
 
+@user_router.post("/items/check_prices", response_model=List[schemas.PriceQuoteResult])
+def check_prices(quotes: List[schemas.PriceQuote], db: Session = Depends(get_db)):
+    return crud.check_item_prices(db, quotes=quotes)
+
+@user_router.get("/items/inventory/", response_model=Dict[int, schemas.ItemAvailability])
+def get_all_available_inventory(db: Session = Depends(get_db)):
+    return crud.get_all_available_inventory(db)
+
 @user_router.get("/items/inventory/{item_id}", response_model=Dict)
 def get_available_inventory(item_id: int, db: Session = Depends(get_db)):
     inventory = crud.get_available_inventory(db, item_id=item_id)
@@ -130,9 +137,9 @@ def edit_inventory(commit: bool, operation: Operation, order_id: Optional[int] =
         raise HTTPException(status_code=400, detail=str(e))
     
 @user_router.post("/orders-items/inventory/check-impact", response_model=Dict)
-def edit_inventory(order_item_config: schemas.OrderItemConfig, db: Session = Depends(get_db)):
+def edit_inventory(order_item_config: schemas.OrderItemConfig, explain: bool = False, db: Session = Depends(get_db)):
     try:
-        return crud.check_inventory_impact(db, order_item_config=order_item_config)
+        return crud.check_inventory_impact(db, order_item_config=order_item_config, explain=explain)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=str(e))
@@ -148,7 +155,10 @@ def add_to_active_order(order_id: int, item_id: int, configurations: List[Dict],
     item = crud.get_item(db, item_id=item_id)
     if any([not order, not item]):
         raise HTTPException(status_code=404, detail="Order or item not found")
-    return crud.add_to_active_order(db=db, db_order=order, db_item=item, configurations=configurations)
+    try:
+        return crud.add_to_active_order(db=db, db_order=order, db_item=item, configurations=configurations)
+    except pricing.PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @user_router.patch("/orders/{order_id}/update", response_model=schemas.Order)
 def update_order(order_id: int, order: schemas.Order, db: Session = Depends(get_db)):
@@ -168,17 +178,37 @@ def get_orders(status: str = "submitted", db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="No orders found")
     return db_orders
 
-@user_router.post("/orders/{order_id}/print_receipt", response_model=schemas.Order)
+# Order changes after since, for a terminal catching up after being offline
+@user_router.get("/order-events/", response_model=schemas.OrderEventFeed)
+def get_order_events(since: int = 0, limit: int = crud.MAX_ORDER_EVENTS, db: Session = Depends(get_db)):
+    return crud.get_order_events(db, since=since, limit=limit)
+
+@user_router.post("/orders/{order_id}/print_receipt", response_model=schemas.PrintJob)
 def print_receipt(order_id: int, db: Session = Depends(get_db)):
     db_order = crud.get_order(db, order_id=order_id)
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     return crud.print_receipt(db, db_order=db_order)
 
-@user_router.post("/orders/{order_id}/print_tickets", response_model=List[schemas.Ticket])
+@user_router.post("/orders/{order_id}/print_tickets", response_model=List[schemas.PrintJob])
 def print_tickets(order_id: int, tickets: List[schemas.Ticket], db: Session = Depends(get_db)):
     return crud.print_tickets(db, order_id, tickets)
 
+@user_router.get("/realtime-stats", response_model=schemas.RealtimeStats)
+async def get_realtime_stats():
+    return manager.stats()
+
+@user_router.get("/render-stats", response_model=schemas.RenderStats)
+def get_render_stats():
+    return renderer.stats()
+
+@user_router.get("/print-jobs/{job_id}", response_model=schemas.PrintJob)
+def get_print_job(job_id: int, db: Session = Depends(get_db)):
+    db_job = crud.get_print_job(db, job_id=job_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Print job not found")
+    return db_job
+
 @user_router.delete("/orders/{order_id}/delete", response_model=schemas.Order)
 def delete_order(order_id: int, db: Session = Depends(get_db)):
     db_order = crud.get_order(db, order_id=order_id)
@@ -199,7 +229,10 @@ def get_order_item(order_item_id: int, db: Session = Depends(get_db)):
 
 @user_router.patch("/orders-items/{order_item_id}/update", response_model=schemas.OrderItemUpdate)
 def update_order_item(order_item_id: int, order_item_update: schemas.OrderItemUpdate, db: Session = Depends(get_db)):
-    db_order_item = crud.update_order_item(db=db, order_item_id=order_item_id, order_item_update=order_item_update)
+    try:
+        db_order_item = crud.update_order_item(db=db, order_item_id=order_item_id, order_item_update=order_item_update)
+    except pricing.PricingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not db_order_item:
         raise HTTPException(status_code=404, detail="Order item not found")
     return db_order_item
@@ -213,12 +246,18 @@ def delete_order_item(order_item_id: int, db: Session = Depends(get_db)):
 
 # CRUD endpoints for categories
 @user_router.get("/categories/", response_model=Union[List[schemas.Category], List[schemas.CategoryWithItems]])
-def read_categories(include_items: bool = Query(False, description="Include items in response"), db: Session = Depends(get_db)):
+def read_categories(
+    include_items: bool = Query(False, description="Include items in response"),
+    include_availability: bool = Query(False, description="Flag sold out items, only with include_items"),
+    db: Session = Depends(get_db),
+):
     categories = crud.get_categories(db, include_items=include_items)
     if not categories:
         raise HTTPException(status_code=404, detail="No categories found")
     if include_items:
-        return [schemas.CategoryWithItems.model_validate(category) for category in categories]
+        categories = [schemas.CategoryWithItems.model_validate(category) for category in categories]
+        crud.with_inventory_balances(db, [item for category in categories for item in category.items], flag_sold_out=include_availability)
+        return categories
     else:
         return [schemas.Category.model_validate(category) for category in categories]
 
@@ -226,7 +265,22 @@ def read_categories(include_items: bool = Query(False, description="Include item
 def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_db)):
     return crud.create_category(db=db, category=category)
 
-@user_router.post("/open-drawer")
+@admin_router.get("/printer-routes/", response_model=List[schemas.PrinterRoute])
+def get_printer_routes(db: Session = Depends(get_db)):
+    return crud.get_printer_routes(db)
+
+@admin_router.post("/printer-routes/", response_model=schemas.PrinterRoute)
+def create_printer_route(route: schemas.PrinterRouteCreate, db: Session = Depends(get_db)):
+    return crud.create_printer_route(db, route)
+
+@admin_router.delete("/printer-routes/{route_id}", response_model=schemas.PrinterRoute)
+def delete_printer_route(route_id: int, db: Session = Depends(get_db)):
+    db_route = crud.delete_printer_route(db, route_id)
+    if db_route is None:
+        raise HTTPException(status_code=404, detail="Printer route not found")
+    return db_route
+
+@user_router.post("/open-drawer", response_model=schemas.PrintJob)
 def open_drawer(db: Session = Depends(get_db)):
     return crud.open_cash_drawer(db)
 
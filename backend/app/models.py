@@ -1,6 +1,6 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Float, Boolean
+from sqlalchemy import BigInteger, CheckConstraint, Column, ForeignKey, Integer, String, DateTime, Float, Boolean, LargeBinary, func
 from sqlalchemy.dialects.postgresql import JSONB, ARRAY
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from database import Base
 import datetime
 
@@ -25,11 +25,53 @@ class Item(Base):
     category_id = Column(Integer, ForeignKey("categories.id"))
     tax_rate = Column(Float, default=0.0)
     inventory_config = Column(JSONB, index=True)
+    # bumped on every update, compiled pricing plans are cached per version
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # prices of every option combination for items priced purely by options, see pricing.build_price_table
+    price_table = deferred(Column(JSONB, nullable=True))
 
     category = relationship("Category", back_populates="items")
     orders = relationship("OrderItem", back_populates="item")
 
 
+# current stock per item & inventory bucket (the selected value of the field inventory depends on)
+class InventoryBalance(Base):
+    __tablename__ = "inventory_balances"
+
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(String, primary_key=True)
+    amount = Column(Float, nullable=False, default=0.0)
+    # stock held by pending orders, available = amount - reserved
+    reserved = Column(Float, nullable=False, default=0.0, server_default="0")
+    # bumped on every change, lets terminals drop inventory-delta messages that arrive out of order
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+
+# stock an order item of a pending order holds, made final when the order is submitted & released
+# when the order expires or is deleted
+class InventoryReservation(Base):
+    __tablename__ = "inventory_reservations"
+
+    order_item_id = Column(Integer, ForeignKey("order_items.id", ondelete="CASCADE"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(String, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    amount = Column(Float, nullable=False)
+
+
+# append only log of every change to an inventory balance
+class InventoryMovement(Base):
+    __tablename__ = "inventory_movements"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=False, index=True)
+    bucket = Column(String, nullable=False)
+    delta = Column(Float, nullable=False)
+    order_item_id = Column(Integer, ForeignKey("order_items.id", ondelete="SET NULL"), nullable=True, index=True)
+    reason = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
 # order table
 class Order(Base):
     __tablename__ = "orders"
@@ -104,6 +146,49 @@ class Printer(Base):
     name = Column(String, index=True)
 
 
+# sends the ticket lines of a category, or of one item, to a station's printer. An item's own routes win
+# over its category's, lines without any go to the front printer.
+class PrinterRoute(Base):
+    __tablename__ = "printer_routes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    printer_id = Column(Integer, ForeignKey("printers.id", ondelete="CASCADE"), nullable=False, index=True)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("(category_id IS NULL) <> (item_id IS NULL)", name="printer_routes_category_or_item"),
+    )
+
+
+# something to print, fed to its printer by the spooler & kept until printed so nothing is lost on a restart
+class PrintJob(Base):
+    __tablename__ = "print_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    printer_id = Column(Integer, ForeignKey("printers.id", ondelete="CASCADE"), nullable=False, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    kind = Column(String, nullable=False)
+    # bytes sent to the printer as is, dropped once they're printed
+    data = deferred(Column(LargeBinary, nullable=True))
+    status = Column(String, nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+# A change to an order, its id is the sequence number terminals resume from. Outlives the order.
+class OrderEvent(Base):
+    __tablename__ = "order_events"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    order_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
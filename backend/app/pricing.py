@@ -0,0 +1,451 @@
+import math, operator
+from itertools import product
+from typing import Dict, List, Optional, Tuple
+
+# example of item form config
+# [
+#     {
+#         "type": "single_select",
+#         "label": "Size",
+#         "order": 0,
+#         "options": [
+#             "#1",
+#             "#2"
+#         ],
+#         "pricing_config": {
+#             "priceBy": "Per Option",
+#             "dependsOn": {
+#                 "name": "",
+#                 "values": {}
+#             },
+#             "isBasePrice": true,
+#             "priceFactor": "+",
+#             "affectsPrice": true,
+#             "constantValue": "0",
+#             "perOptionMapping": {
+#                 "1": "44",
+#                 "2": "25",
+#                 "#1": "40",
+#                 "#2": "32"
+#             }
+#         }
+#     },
+#     {
+#         "type": "single_select",
+#         "label": "Amount Type",
+#         "order": 1,
+#         "options": [
+#             "Bushel",
+#             "Dz",
+#             "Half bushel"
+#         ],
+#         "pricing_config": {
+#             "priceBy": "Dependency",
+#             "dependsOn": {
+#                 "name": "Size",
+#                 "values": {
+#                     "Dz": {
+#                         "#1": "1",
+#                         "#2": "1"
+#                     },
+#                     "Bushel": {
+#                         "#1": "3.18",
+#                         "#2": "0"
+#                     },
+#                     "Half bushel": {
+#                         "#1": "0",
+#                         "#2": "0"
+#                     }
+#                 }
+#             },
+#             "isBasePrice": false,
+#             "priceFactor": "×",
+#             "affectsPrice": true,
+#             "constantValue": "0",
+#             "perOptionMapping": {}
+#         }
+#     },
+#     {
+#         "type": "number",
+#         "label": "Amount",
+#         "order": 2,
+#         "options": [],
+#         "pricing_config": {
+#             "priceBy": "Input",
+#             "dependsOn": {
+#                 "name": "",
+#                 "values": {}
+#             },
+#             "isBasePrice": false,
+#             "priceFactor": "×",
+#             "affectsPrice": true,
+#             "constantValue": "1",
+#             "perOptionMapping": {}
+#         }
+#     },
+#     {
+#         "type": "single_select",
+#         "label": "Spice",
+#         "order": 3,
+#         "options": [
+#             "gar",
+#             "hot",
+#             "reg"
+#         ],
+#         "pricing_config": {
+#             "priceBy": "",
+#             "dependsOn": {
+#                 "name": "",
+#                 "values": {}
+#             },
+#             "isBasePrice": false,
+#             "priceFactor": "",
+#             "affectsPrice": false,
+#             "constantValue": "0",
+#             "perOptionMapping": {}
+#         }
+#     }
+# ]
+
+# step kinds, one per supported "priceBy"
+CONSTANT = "constant"  # "Constant" and "Input" both price by constantValue
+PER_OPTION = "per_option"
+OPTION_VALUE = "option_value"
+SCALED_OPTION_VALUE = "scaled_option_value"
+DEPENDENCY = "dependency"
+
+PRICE_BY_KINDS = {
+    "Constant": CONSTANT,
+    "Input": CONSTANT,
+    "Per Option": PER_OPTION,
+    "Option Value": OPTION_VALUE,
+    "Scaled Option Value": SCALED_OPTION_VALUE,
+    "Dependency": DEPENDENCY,
+}
+
+# operators allowed on the base price
+BASE_OPERATORS = {
+    "+": operator.add,
+    "increment": operator.add,
+    "-": operator.sub,
+    "decrement": operator.sub,
+    "×": operator.mul,
+    "multiply": operator.mul,
+}
+
+# where a step puts its value
+BASE = "base"
+ADDER = "adders"
+MULTIPLIER = "multipliers"
+
+
+class PricingError(ValueError):
+    pass
+
+
+class Unparsable:
+    # stands in for a mapping value that float() rejected when the plan was compiled,
+    # the error is raised when (and only if) pricing actually reaches it
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def value(self):
+        return number_input(self.raw)
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return Unparsable(value)
+
+
+# float() of a value from a form config or a quote, one it can't take at all (null, a list) is bad input
+# just like a string that isn't a number
+def number_input(value):
+    try:
+        return float(value)
+    except TypeError:
+        raise PricingError(f"{value!r} is not a number")
+
+
+def resolve(value):
+    return value.value() if value.__class__ is Unparsable else value
+
+
+class PricingStep:
+    __slots__ = ("index", "label", "kind", "is_base_price", "operator", "base_operator", "target", "constant", "mapping", "depends_on", "depends_on_index")
+
+    def __init__(self, index: int, form_config: dict):
+        pricing_config = form_config.get("pricing_config", {})
+        price_by = pricing_config.get("priceBy")
+
+        self.index = index
+        self.label = form_config.get("label")
+        self.kind = PRICE_BY_KINDS[price_by]
+        self.is_base_price = pricing_config.get("isBasePrice", False)
+        self.operator = pricing_config.get("priceFactor", "+")  # Defaulting to addition if not specified
+        self.base_operator = BASE_OPERATORS.get(self.operator)
+        self.target = ADDER if self.operator == "+" else MULTIPLIER
+        self.constant = None
+        self.mapping = None
+        self.depends_on = None
+        self.depends_on_index = None
+
+        if self.kind in (CONSTANT, SCALED_OPTION_VALUE):
+            self.constant = to_number(pricing_config.get("constantValue", 0))
+        elif self.kind == PER_OPTION:
+            self.mapping = {
+                option: to_number(value)
+                for option, value in pricing_config.get("perOptionMapping", {}).items()
+            }
+        elif self.kind == DEPENDENCY:
+            depends_on = pricing_config["dependsOn"]
+            self.depends_on = depends_on.get("name")
+            # option of this field -> option of the field it depends on -> value
+            self.mapping = {
+                option: {dependency_option: to_number(value) for dependency_option, value in values.items()}
+                for option, values in depends_on.get("values").items()
+            }
+
+    def apply_base(self, value, base_price):
+        if self.base_operator is None:
+            raise ValueError(f"Unsupported operation {self.operator}")
+        return self.base_operator(base_price, value)
+
+
+# A pricing plan is an item's form_cfg compiled once into the steps calculate_prices used to
+# re-derive on every call: numbers are parsed up front, per option and dependency mappings are
+# plain dict lookups and the steps are already in evaluation order (multipliers last).
+class PricingPlan:
+    def __init__(self, form_cfg: List[dict], tax_rate: float, version: Optional[int] = None, price_table: Optional[dict] = None):
+        self.version = version
+        self.tax_rate = tax_rate / 100
+        self.labels = [form_config.get("label") for form_config in form_cfg]
+        self.keyed_fields = None
+        self.price_table = None
+        if price_table:
+            self.load_price_table(price_table)
+
+        # Sort configurations so that multipliers are processed last
+        order = sorted(
+            range(len(form_cfg)),
+            key=lambda i: (
+                form_cfg[i].get("pricing_config", {}).get("priceBy") == "Option Value",
+                form_cfg[i].get("pricing_config", {}).get("priceBy")
+                in ("Scaled Option Value", "Dependency"),
+            ),
+        )
+        # every field in evaluation order
+        self.order = order
+        self.steps = [
+            PricingStep(i, form_cfg[i])
+            for i in order
+            if form_cfg[i].get("pricing_config", {}).get("priceBy") in PRICE_BY_KINDS
+        ]
+
+        # position of each label in the form, a dependency normally finds its value right there
+        label_index = {}
+        for i in reversed(order):
+            label_index[form_cfg[i].get("label")] = i
+        for step in self.steps:
+            if step.kind == DEPENDENCY:
+                step.depends_on_index = label_index.get(step.depends_on)
+
+    # label -> selected value, for configurations that don't line up with the form
+    def selected_values(self, configurations: List[dict]) -> dict:
+        count = len(configurations)
+        selected = {}
+        for i in reversed(self.order):
+            if i < count:
+                selected[configurations[i].get("label")] = configurations[i].get("value")
+        return selected
+
+    def dependency_value(self, step: PricingStep, item_value, dependency_value):
+        options = step.mapping.get(item_value)
+        if options is None:
+            raise PricingError(f'"{step.label}" has no price for "{item_value}"')
+        value = options.get(dependency_value)
+        if value is None:
+            raise PricingError(f'"{step.label}" has no price for "{item_value}" with {step.depends_on} "{dependency_value}"')
+        return resolve(value)
+
+    # Walk the plan for one set of order item configurations, returning the base price and the
+    # multipliers & adders to apply to it
+    def collect(self, configurations: List[dict], trace: Optional[list] = None) -> Tuple[float, List[float], List[float]]:
+        base_price = 0
+        multipliers = []
+        adders = []
+        count = len(configurations)
+        # label -> value, only built (once) if the configurations don't line up with the form
+        selected = None
+
+        for step in self.steps:
+            # configurations are paired positionally with the form config
+            if step.index >= count:
+                continue
+            item_value = configurations[step.index].get("value", 0)
+            kind = step.kind
+
+            if kind == CONSTANT:
+                value = resolve(step.constant)
+                applied_to = BASE if step.is_base_price else step.target
+            elif kind == PER_OPTION:
+                value = resolve(step.mapping.get(item_value, 0.0))
+                applied_to = BASE if step.is_base_price else ADDER
+            elif kind == OPTION_VALUE:
+                value = number_input(item_value)
+                applied_to = MULTIPLIER
+            elif kind == SCALED_OPTION_VALUE:
+                value = resolve(step.constant) * number_input(item_value)
+                applied_to = MULTIPLIER
+            else:
+                index = step.depends_on_index
+                if index is not None and index < count and configurations[index].get("label") == step.depends_on:
+                    dependency_value = configurations[index].get("value")
+                else:
+                    if selected is None:
+                        selected = self.selected_values(configurations)
+                    if step.depends_on not in selected:
+                        raise PricingError(f'"{step.label}" depends on "{step.depends_on}", which was not provided')
+                    dependency_value = selected[step.depends_on]
+                value = self.dependency_value(step, item_value, dependency_value)
+                applied_to = step.target
+
+            if applied_to is BASE:
+                base_price = step.apply_base(value, base_price)
+            elif applied_to is ADDER:
+                adders.append(value)
+            else:
+                multipliers.append(value)
+
+            if trace is not None:
+                trace.append({
+                    "label": step.label,
+                    "price_by": kind,
+                    "value": item_value,
+                    "amount": value,
+                    "applied_to": applied_to,
+                    "operator": step.operator,
+                    "base_price": base_price,
+                })
+
+        return base_price, multipliers, adders
+
+    def finalize(self, base_price: float, multipliers: List[float], adders: List[float], trace: Optional[list] = None) -> Tuple[float, float]:
+        final_price = base_price
+
+        # Apply all multipliers sequentially
+        for multiplier in multipliers:
+            final_price *= multiplier
+
+        final_price += sum(adders)
+        final_price += final_price * self.tax_rate
+
+        if trace is not None:
+            trace.append({
+                "base_price": base_price,
+                "multipliers": multipliers,
+                "adders": adders,
+                "tax_rate": self.tax_rate,
+                "final_price": final_price,
+            })
+
+        # return total price w/ tax & tax amount
+        return (round(max(0, final_price), 2), round(final_price * self.tax_rate, 2))
+
+    def load_price_table(self, price_table: dict):
+        self.keyed_fields = price_table["fields"]
+        count = len(self.keyed_fields)
+        self.price_table = {tuple(row[:count]): (row[count], row[count + 1]) for row in price_table["rows"]}
+
+    # Price straight from the precomputed table, None when the item has no table or the
+    # configurations are not one of its enumerated option combinations
+    def lookup(self, configurations: List[dict]) -> Optional[Tuple[float, float]]:
+        if self.price_table is None or len(configurations) < len(self.labels):
+            return None
+        try:
+            for label, item_config in zip(self.labels, configurations):
+                if item_config.get("label") != label:
+                    return None
+            return self.price_table.get(tuple(configurations[i].get("value") for i in self.keyed_fields))
+        except (AttributeError, TypeError):
+            return None
+
+    def price(self, configurations: List[dict]) -> Tuple[float, float]:
+        found = self.lookup(configurations)
+        if found is not None:
+            return found
+        return self.finalize(*self.collect(configurations))
+
+
+# price tables are only built for items with at most this many option combinations
+MAX_PRICE_TABLE_SIZE = 4096
+
+# free form values can't be enumerated, items using these always go through the plan
+FREE_FORM_PRICE_BY = ("Input", "Option Value", "Scaled Option Value")
+
+
+# Enumerate every option combination of an item whose price only depends on selected options
+# ("Per Option" & "Dependency" fields) and price each one once. Returns the table to store with
+# the item, or None if the item has free form fields or too many combinations.
+def build_price_table(form_cfg: List[dict], tax_rate: float) -> Optional[dict]:
+    form_cfg = form_cfg or []
+    price_bys = [form_config.get("pricing_config", {}).get("priceBy") for form_config in form_cfg]
+    if any(price_by in FREE_FORM_PRICE_BY for price_by in price_bys):
+        return None
+
+    dependency_names = {
+        form_config["pricing_config"]["dependsOn"].get("name")
+        for form_config, price_by in zip(form_cfg, price_bys)
+        if price_by == "Dependency"
+    }
+    fields = [
+        i
+        for i, (form_config, price_by) in enumerate(zip(form_cfg, price_bys))
+        if price_by in ("Per Option", "Dependency") or form_config.get("label") in dependency_names
+    ]
+    if not fields:
+        return None
+
+    options = [form_cfg[i].get("options") or [] for i in fields]
+    if any(not field_options for field_options in options) or math.prod(map(len, options)) > MAX_PRICE_TABLE_SIZE:
+        return None
+
+    plan = PricingPlan(form_cfg, tax_rate or 0.0)
+    configurations = [{"label": form_config.get("label"), "value": ""} for form_config in form_cfg]
+    rows = []
+    for values in product(*options):
+        for i, value in zip(fields, values):
+            configurations[i]["value"] = value
+        try:
+            price, tax = plan.finalize(*plan.collect(configurations))
+        except Exception:
+            # combinations that can't be priced are left to the normal path
+            continue
+        rows.append([*values, price, tax])
+
+    return {"fields": fields, "rows": rows}
+
+
+# compiled plans by item id, each tagged with the item version it was compiled from
+plans: Dict[int, PricingPlan] = {}
+
+
+def compile_plan(db_item) -> PricingPlan:
+    plan = PricingPlan(db_item.form_cfg or [], db_item.tax_rate or 0.0, version=db_item.version, price_table=db_item.price_table)
+    plans[db_item.id] = plan
+    return plan
+
+
+def get_plan(db_item) -> PricingPlan:
+    plan = plans.get(db_item.id)
+    if plan is None or plan.version != db_item.version:
+        plan = compile_plan(db_item)
+    return plan
+
+
+def invalidate_plan(item_id: int):
+    plans.pop(item_id, None)
@@ -0,0 +1,225 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import logging, select, socket, threading, time
+import backplane, models, schemas, realtime
+
+logger = logging.getLogger('uvicorn.error')
+
+# Printers & the restaurant are read on every print and drawer kick but hardly ever change, so they're
+# cached in memory. A commit changing them through the ORM clears the cache of this worker and, over the
+# WebSocket backplane, of the others. The TTL catches rows edited straight in the database.
+CACHE_TTL_SECONDS = 300
+
+# takes receipts, drawer kicks & every ticket line not routed to a station
+FRONT_PRINTER = "front"
+
+CONNECT_TIMEOUT = 10
+SEND_TIMEOUT = 10
+CHUNK_SIZE = 16384
+# TCP keepalive, so a printer that drops off the network is noticed on an idle connection
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+CACHED_MODELS = (models.Printer, models.Restaurant, models.PrinterRoute)
+# the backplane signal other workers clear their cache on
+CACHE_SIGNAL = "printers-changed"
+
+cache: Dict[str, object] = {}
+cache_lock = threading.Lock()
+# bumped on every invalidation, so a load that started before it isn't cached
+cache_generation = 0
+
+
+def invalidate_cache():
+    global cache_generation
+    with cache_lock:
+        cache.clear()
+        cache_generation += 1
+
+
+backplane.on_signal(CACHE_SIGNAL, invalidate_cache)
+
+
+# Changes are only noted at flush, the cache is cleared once they're committed. Clearing it any earlier
+# would let a concurrent request cache the rows from before the commit again.
+@event.listens_for(Session, "after_flush")
+def note_cached_changes(db: Session, flush_context):
+    if any(isinstance(instance, CACHED_MODELS) for instance in (*db.new, *db.dirty, *db.deleted)):
+        db.info["printers_changed"] = True
+
+
+# bulk query(...).update() & .delete() don't go through the flush
+@event.listens_for(Session, "do_orm_execute")
+def note_bulk_cached_changes(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None:
+        if orm_execute_state.bind_mapper.class_ in CACHED_MODELS:
+            orm_execute_state.session.info["printers_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_changes(db: Session):
+    if db.info.pop("printers_changed", False):
+        invalidate_cache()
+        realtime.manager.backplane.signal(CACHE_SIGNAL)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_cached_changes(db: Session):
+    db.info.pop("printers_changed", None)
+
+
+def cached(key: str, load):
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < CACHE_TTL_SECONDS:
+            return entry[1]
+        generation = cache_generation
+    value = load()
+    with cache_lock:
+        if generation == cache_generation:
+            cache[key] = (time.monotonic(), value)
+    return value
+
+
+def load_printers(db: Session) -> Dict[str, Dict]:
+    printers = [schemas.Printer.model_validate(db_printer) for db_printer in db.query(models.Printer).order_by(models.Printer.id)]
+    return {
+        "by_id": {printer.id: printer for printer in printers},
+        # the first printer of a name wins, like .filter(name == ...).first() did
+        "by_name": {printer.name: printer for printer in reversed(printers)},
+    }
+
+
+def get_printer(db: Session, name: str) -> Optional[schemas.Printer]:
+    return cached("printers", lambda: load_printers(db))["by_name"].get(name)
+
+
+def get_printer_by_id(db: Session, printer_id: int) -> Optional[schemas.Printer]:
+    return cached("printers", lambda: load_printers(db))["by_id"].get(printer_id)
+
+
+# printer ids by item id & by category id
+def get_routes(db: Session) -> Dict[str, Dict[int, List[int]]]:
+    def load():
+        routes = {"items": {}, "categories": {}}
+        for db_route in db.query(models.PrinterRoute).order_by(models.PrinterRoute.id):
+            if db_route.item_id is not None:
+                routes["items"].setdefault(db_route.item_id, []).append(db_route.printer_id)
+            else:
+                routes["categories"].setdefault(db_route.category_id, []).append(db_route.printer_id)
+        return routes
+    return cached("routes", load)
+
+
+# The printers a ticket line for an item goes to
+def route(db: Session, item_id: int, category_id: Optional[int]) -> List[schemas.Printer]:
+    routes = get_routes(db)
+    printer_ids = routes["items"].get(item_id) or routes["categories"].get(category_id) or []
+    stations = [get_printer_by_id(db, printer_id) for printer_id in printer_ids]
+    stations = [printer for printer in stations if printer is not None]
+    if not stations:
+        front = get_printer(db, FRONT_PRINTER)
+        return [front] if front else []
+    return stations
+
+
+def get_restaurant(db: Session) -> Optional[schemas.Restaurant]:
+    def load():
+        db_restaurant = db.query(models.Restaurant).first()
+        return schemas.Restaurant.model_validate(db_restaurant) if db_restaurant else None
+    return cached("restaurant", load)
+
+
+# One long lived connection to a printer, used by the spooler's worker for it. Drawer kicks are print
+# jobs too, so they queue behind a raster job instead of landing in the middle of it.
+class PrinterConnection:
+    def __init__(self):
+        self.sock: Optional[socket.socket] = None
+        self.address = None
+        # bytes of the last write the socket took, whether or not it went through
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def connect(self, address):
+        self.close()
+        sock = socket.create_connection(address, timeout=CONNECT_TIMEOUT)
+        sock.settimeout(SEND_TIMEOUT)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_COUNT)
+        self.sock = sock
+        self.address = address
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    # An idle connection the printer has closed reads as EOF, anything else it sent (status bytes)
+    # is thrown away
+    def healthy(self) -> bool:
+        try:
+            while select.select([self.sock], [], [], 0)[0]:
+                if not self.sock.recv(4096):
+                    return False
+            return True
+        except OSError:
+            return False
+
+    # Hands data over as fast as the printer takes it: whenever the socket has room in its send buffer
+    # as much as fits goes out, a printer that stops reading for SEND_TIMEOUT fails the write
+    def write(self, data: bytes):
+        view = memoryview(data)
+        self.sent = 0
+        while self.sent < len(data):
+            if not select.select([], [self.sock], [], SEND_TIMEOUT)[1]:
+                raise socket.timeout(f"Printer stopped accepting data with {len(data) - self.sent} bytes left to send")
+            self.sent += self.sock.send(view[self.sent : self.sent + CHUNK_SIZE])
+
+    def send(self, printer: schemas.Printer, data: bytes):
+        address = (printer.ip, printer.port)
+        with self.lock:
+            reused = self.sock is not None and self.address == address and self.healthy()
+            if not reused:
+                self.connect(address)
+            try:
+                self.write(data)
+            except OSError as e:
+                self.close()
+                # Part of the job may already be printing (or the drawer open), sending it again would
+                # print it twice, so that's left to the spooler's retries
+                if not reused or self.sent:
+                    raise
+                # the warm connection went stale since it was checked, try once more on a new one
+                logger.info(f"Reconnecting to printer {printer.name} after: {e}")
+                self.connect(address)
+                try:
+                    self.write(data)
+                except OSError:
+                    self.close()
+                    raise
+
+
+connections: Dict[int, PrinterConnection] = {}
+connections_lock = threading.Lock()
+
+
+def send(printer: schemas.Printer, data: bytes):
+    with connections_lock:
+        connection = connections.setdefault(printer.id, PrinterConnection())
+    connection.send(printer, data)
+
+
+def close_all():
+    with connections_lock:
+        for connection in connections.values():
+            with connection.lock:
+                connection.close()
+        connections.clear()
@@ -0,0 +1,277 @@
+from fastapi import WebSocket
+from collections import deque
+from typing import Dict, List, Optional, Set
+import asyncio, json, logging, time
+import msgpack
+from backplane import create_backplane
+
+logger = logging.getLogger('uvicorn.error')
+
+# Every connection gets its own bounded queue of outgoing messages & a writer task draining it, so a
+# broadcast only has to put the message on the queues. A terminal on bad Wi-Fi falls behind on its own
+# queue instead of holding up everyone else's updates, and once it's SEND_QUEUE_SIZE messages behind
+# (or a single send hangs for SEND_TIMEOUT) it's disconnected; it reloads its state when it reconnects.
+SEND_QUEUE_SIZE = 256
+SEND_TIMEOUT = 10
+# fan-out latencies kept for the stats
+LATENCY_SAMPLES = 1000
+
+# Clients pick how messages are framed with the WebSocket subprotocol they ask for. Without one (or with
+# "json") every message is a text frame of its own, like it always was. With "msgpack" messages are
+# collected for COALESCE_SECONDS after the first one comes in and sent as one binary frame holding a
+# msgpack array of them, so a burst of updates (an item added, its stock & the print job) is a single
+# frame. Clients still send JSON text either way.
+JSON = "json"
+MSGPACK = "msgpack"
+ENCODINGS = (MSGPACK, JSON)
+COALESCE_SECONDS = 0.01
+# messages in one frame at most
+COALESCE_MAX = 64
+
+# Clients pick what they hear about with {"type": "subscribe", "topics": [...]} (and "unsubscribe"), a
+# client that never subscribes hears everything like it always did. Messages are sorted into topics by
+# their type:
+#   orders, orders:{id}  order-submit, order-update, order-delete, order-event
+#   inventory            inventory-delta
+#   printing             print-job
+#   menu                 items-update, item-*-update, config-update
+TYPE_TOPICS = [("order-", "orders"), ("inventory-", "inventory"), ("print-", "printing"), ("item", "menu"), ("config-", "menu")]
+
+
+def topics_for(message) -> List[str]:
+    if not isinstance(message, dict) or not isinstance(message.get("type"), str):
+        return []
+    for prefix, topic in TYPE_TOPICS:
+        if message["type"].startswith(prefix):
+            payload = message.get("payload")
+            # order-event payloads are the event, which has the order's id as order_id
+            order_id = payload.get("order_id", payload.get("id")) if isinstance(payload, dict) else None
+            if topic == "orders" and order_id is not None:
+                return [topic, f"orders:{order_id}"]
+            return [topic]
+    return []
+
+
+# A message as msgpack, what isn't JSON (clients relay anything) as a string
+def pack(data: str) -> bytes:
+    try:
+        message = json.loads(data)
+    except ValueError:
+        message = data
+    return msgpack.packb(message)
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, encoding: str = JSON):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+        # None until the client subscribes to something
+        self.topics: Optional[Set[str]] = None
+
+
+# WebSocket connection manager
+class ConnectionManager:
+    def __init__(self, backplane=None):
+        # carries broadcasts to the other uvicorn workers' clients, see backplane.py
+        self.backplane = backplane or create_backplane()
+        self.active_connections: Dict[WebSocket, Connection] = {}
+        # connections by the topics they're subscribed to, the rest hear everything
+        self.subscribers: Dict[str, Set[Connection]] = {}
+        self.everything: Set[Connection] = set()
+        # the event loop the connections live on, set when the app starts
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.broadcasts = 0
+        self.sent = 0
+        self.frames = 0
+        self.evicted = 0
+        # seconds from a message being queued to it being written to the socket
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.backplane.start(self.deliver)
+
+    def stop(self):
+        self.backplane.stop()
+
+    async def connect(self, websocket: WebSocket):
+        # the first encoding the client offers that we speak
+        offered = [protocol for protocol in websocket.scope.get("subprotocols", []) if protocol in ENCODINGS]
+        await websocket.accept(subprotocol=offered[0] if offered else None)
+        connection = Connection(websocket, offered[0] if offered else JSON)
+        connection.writer = asyncio.create_task(self.write(connection))
+        self.active_connections[websocket] = connection
+        self.everything.add(connection)
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            self.drop(connection)
+
+    # A message from a client, either (un)subscribing it or relayed to everyone interested
+    def receive(self, websocket: WebSocket, data: str):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+        if isinstance(message, dict) and message.get("type") in ("subscribe", "unsubscribe"):
+            connection = self.active_connections.get(websocket)
+            topics = message.get("topics")
+            if connection is None or not isinstance(topics, list):
+                return
+            topics = [topic for topic in topics if isinstance(topic, str)]
+            if message["type"] == "subscribe":
+                self.subscribe(connection, topics)
+            else:
+                self.unsubscribe(connection, topics)
+            return
+        self.send(data, topics_for(message), sender=websocket)
+
+    def subscribe(self, connection: Connection, topics: List[str]):
+        if connection.topics is None:
+            connection.topics = set()
+            self.everything.discard(connection)
+        for topic in topics:
+            connection.topics.add(topic)
+            self.subscribers.setdefault(topic, set()).add(connection)
+
+    def unsubscribe(self, connection: Connection, topics: List[str]):
+        if connection.topics is None:
+            # a client that heard everything hears only what it subscribes to from here on
+            connection.topics = set()
+            self.everything.discard(connection)
+        for topic in topics:
+            connection.topics.discard(topic)
+            subscribers = self.subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.subscribers[topic]
+
+    async def write(self, connection: Connection):
+        while True:
+            batch = [await connection.queue.get()]
+            if connection.encoding == MSGPACK:
+                await asyncio.sleep(COALESCE_SECONDS)
+                while len(batch) < COALESCE_MAX and not connection.queue.empty():
+                    batch.append(connection.queue.get_nowait())
+                # the messages are packed already, a frame is an array of them
+                send = connection.websocket.send_bytes(
+                    msgpack.Packer().pack_array_header(len(batch)) + b"".join(data for data, _ in batch)
+                )
+            else:
+                send = connection.websocket.send_text(batch[0][0])
+            try:
+                await asyncio.wait_for(send, SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.evict(connection, f"a send took over {SEND_TIMEOUT} s")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # the client went away, its receive loop cleans up the rest
+                self.drop(connection)
+                return
+            self.frames += 1
+            self.sent += len(batch)
+            sent_at = time.monotonic()
+            self.latencies.extend(sent_at - queued_at for _, queued_at in batch)
+
+    # Stops sending to a connection, returns whether it was still open
+    def drop(self, connection: Connection) -> bool:
+        if self.active_connections.get(connection.websocket) is not connection:
+            return False
+        del self.active_connections[connection.websocket]
+        self.everything.discard(connection)
+        if connection.topics:
+            self.unsubscribe(connection, list(connection.topics))
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        return True
+
+    # Disconnects a client that can't keep up
+    def evict(self, connection: Connection, reason: str):
+        if not self.drop(connection):
+            return
+        self.evicted += 1
+        logger.warning(f"Dropping WebSocket client {connection.websocket.client}, {reason}")
+        # 1013, try again later
+        asyncio.get_running_loop().create_task(self.close(connection.websocket, 1013))
+
+    async def close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code), SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    # Queues data for everyone subscribed to one of topics & everyone not subscribed to anything, but
+    # the sender. Never waits on a client.
+    def broadcast(self, data: str, topics: List[str] = (), sender: WebSocket = None):
+        self.broadcasts += 1
+        queued_at = time.monotonic()
+        recipients = set(self.everything)
+        for topic in topics:
+            recipients.update(self.subscribers.get(topic, ()))
+        # packed once for all the msgpack clients
+        packed = None
+        for connection in recipients:
+            if connection.websocket == sender:
+                continue
+            if connection.encoding == MSGPACK:
+                if packed is None:
+                    packed = pack(data)
+                item = (packed, queued_at)
+            else:
+                item = (data, queued_at)
+            try:
+                connection.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.evict(connection, f"{SEND_QUEUE_SIZE} messages behind")
+
+    # Broadcasts here & on every other worker
+    def send(self, data: str, topics: List[str] = (), sender: WebSocket = None):
+        self.broadcast(data, topics, sender)
+        self.backplane.publish(data, list(topics))
+
+    # A broadcast from another worker, called on the backplane's thread
+    def deliver(self, data: str, topics: List[str]):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.broadcast, data, topics)
+
+    # Broadcast a server side message from anywhere, including the sync endpoints running in the
+    # threadpool. Messages are dropped while the app isn't running.
+    def publish(self, message: dict):
+        if self.loop is None or self.loop.is_closed():
+            return
+        data = json.dumps(message)
+        topics = topics_for(message)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self.send(data, topics)
+        else:
+            self.loop.call_soon_threadsafe(self.send, data, topics)
+
+    def stats(self) -> Dict:
+        depths = [connection.queue.qsize() for connection in list(self.active_connections.values())]
+        latencies = sorted(self.latencies)
+        return {
+            "connections": len(depths),
+            "broadcasts": self.broadcasts,
+            "sent": self.sent,
+            "frames": self.frames,
+            "evicted": self.evicted,
+            "subscribers": {topic: len(subscribers) for topic, subscribers in list(self.subscribers.items())},
+            "max_queue_depth": max(depths, default=0),
+            "avg_queue_depth": sum(depths) / len(depths) if depths else 0.0,
+            "avg_fanout_ms": sum(latencies) / len(latencies) * 1e3 if latencies else 0.0,
+            "p95_fanout_ms": latencies[int(len(latencies) * 0.95)] * 1e3 if latencies else 0.0,
+            "max_fanout_ms": latencies[-1] * 1e3 if latencies else 0.0,
+        }
+
+
+manager = ConnectionManager()
@@ -0,0 +1,148 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+import logging, multiprocessing, os, threading, time
+import layout, raster
+
+logger = logging.getLogger('uvicorn.error')
+
+# Drawing & raster encoding a receipt is CPU bound and holds the GIL, so it runs in a pool of worker
+# processes instead of the web process' threads. The web process only builds the ReceiptLayout (a
+# list of calls) and gets the printer's bytes back.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", os.cpu_count() or 1))
+# receipts waiting on or being rendered per worker before new ones are turned away
+QUEUE_PER_WORKER = 4
+QUEUE_TIMEOUT = 10
+
+
+class RendererBusy(Exception):
+    pass
+
+
+# Loads the fonts & numpy before the first receipt comes in
+def warm_up():
+    receipt = layout.ReceiptLayout(16)
+    receipt.text("Warm up", center=True)
+    receipt.rule()
+    receipt.row("1 × Warm up", "$0.00")
+    ticket = layout.ReceiptLayout(24)
+    ticket.text("Warm up", font_size=18)
+    for warm in (receipt, ticket):
+        raster.image_to_raster(warm.render(), True)
+
+
+# Runs in a worker, returns the raster & how long it took
+def render(receipt: layout.ReceiptLayout) -> Tuple[bytes, float]:
+    started = time.perf_counter()
+    data = raster.image_to_raster(receipt.render(), True)
+    return data, time.perf_counter() - started
+
+
+class Renderer:
+    def __init__(self, workers: int = RENDER_WORKERS):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.slots = threading.BoundedSemaphore(workers * QUEUE_PER_WORKER)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.renders = 0
+        self.failures = 0
+        self.render_seconds = 0.0
+        self.max_render_seconds = 0.0
+        self.latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+
+    def start(self):
+        # spawned rather than forked, the web process has threads (spooler workers, db pool) by now
+        self.executor = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=warm_up
+        )
+        # a worker is only started when a task finds none idle, so hand every one of them something now
+        # rather than making the first receipts of a rush wait on process start up
+        for _ in range(self.workers):
+            self.executor.submit(os.getpid)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def submit(self, receipt: layout.ReceiptLayout) -> Future:
+        if not self.slots.acquire(timeout=QUEUE_TIMEOUT):
+            raise RendererBusy("Too many receipts waiting to be rendered")
+        with self.lock:
+            self.pending += 1
+        if self.executor is None:
+            # not started (scripts, tests without the app's lifespan), render right here
+            future = Future()
+            try:
+                future.set_result(render(receipt))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            try:
+                future = self.executor.submit(render, receipt)
+            except BrokenProcessPool as e:
+                future = Future()
+                future.set_exception(e)
+        future.add_done_callback(self.done)
+        return future
+
+    def done(self, future: Future):
+        self.slots.release()
+        with self.lock:
+            self.pending -= 1
+
+    # The rasters of every layout, rendered side by side on the pool's workers
+    def render(self, receipts: List[layout.ReceiptLayout]) -> List[bytes]:
+        submitted = time.perf_counter()
+        futures = [self.submit(receipt) for receipt in receipts]
+        rasters = []
+        for future in futures:
+            try:
+                data, seconds = future.result()
+            except BrokenProcessPool:
+                # a worker died (killed, out of memory), the pool can't be used anymore
+                with self.lock:
+                    self.failures += 1
+                self.restart()
+                raise
+            except Exception:
+                with self.lock:
+                    self.failures += 1
+                raise
+            with self.lock:
+                self.renders += 1
+                self.render_seconds += seconds
+                self.max_render_seconds = max(self.max_render_seconds, seconds)
+                latency = time.perf_counter() - submitted
+                self.latency_seconds += latency
+                self.max_latency_seconds = max(self.max_latency_seconds, latency)
+            rasters.append(data)
+        return rasters
+
+    def restart(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            logger.error("Render worker died, restarting the render pool")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.start()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            renders = max(self.renders, 1)
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "queued": max(0, self.pending - self.workers),
+                "renders": self.renders,
+                "failures": self.failures,
+                "avg_render_ms": self.render_seconds / renders * 1e3,
+                "max_render_ms": self.max_render_seconds * 1e3,
+                "avg_latency_ms": self.latency_seconds / renders * 1e3,
+                "max_latency_ms": self.max_latency_seconds * 1e3,
+            }
+
+
+renderer = Renderer()
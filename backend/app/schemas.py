@@ -66,11 +66,17 @@ class ItemDelete(ItemBase):
 
 class Item(ItemBase):
     id: int
+    sold_out: Optional[bool] = None
 
     class Config:
         from_attributes = True
 
 
+class ItemAvailability(BaseModel):
+    amounts: Dict[str, str]
+    sold_out: bool
+
+
 class UpdateItemField(BaseModel):
     field: str
     value: Union[str, int, float]
@@ -157,6 +163,12 @@ class OrderItem(OrderItemBase):
     category_name: str
 
 
+# What an order-event carries for a line of an order
+class OrderLine(OrderItemBase):
+    id: int
+    item_id: int
+
+
 class OrderItemUpdate(BaseModel):
     configurations: Optional[List[Dict]] = None
     quantity: Optional[int] = None
@@ -168,6 +180,24 @@ class OrderItemConfig(BaseModel):
     item_id: Optional[int] = None
 
 
+class PriceExplanation(BaseModel):
+    price: float
+    tax: float
+    trace: List[Dict]
+
+
+class PriceQuote(BaseModel):
+    item_id: int
+    configurations: List[Dict]
+
+
+class PriceQuoteResult(BaseModel):
+    item_id: int
+    price: Optional[float] = None
+    tax: Optional[float] = None
+    error: Optional[str] = None
+
+
 
 class OrderItemDelete(OrderItemBase):
     id: int
@@ -191,6 +221,105 @@ class CategoryWithItems(Category):
     items: List[Item]
 
 
+class Printer(BaseModel):
+    id: int
+    ip: str
+    port: int
+    name: str
+
+    class Config:
+        from_attributes = True
+
+
+class PrinterRouteCreate(BaseModel):
+    printer_id: int
+    category_id: Optional[int] = None
+    item_id: Optional[int] = None
+
+
+class PrinterRoute(PrinterRouteCreate):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
+class Restaurant(BaseModel):
+    id: int
+    name: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    zip_code: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PrintJob(BaseModel):
+    id: int
+    printer_id: int
+    order_id: Optional[int] = None
+    kind: str
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# id is the sequence number, kind one of created, updated, deleted, expired, item-added, item-updated &
+# item-deleted. payload is the Order for created & updated, the OrderLine for item-added & item-updated and
+# {"id": ...} of the line for item-deleted.
+class OrderEvent(BaseModel):
+    id: int
+    order_id: int
+    kind: str
+    payload: Dict
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class OrderEventFeed(BaseModel):
+    events: List[OrderEvent]
+    # the latest event there is, events were limited when it's past the last one returned
+    last_id: int
+    # events the client missed are gone (or it's ahead of the server), it has to reload its orders
+    reset: bool
+
+
+class RenderStats(BaseModel):
+    workers: int
+    pending: int
+    queued: int
+    renders: int
+    failures: int
+    avg_render_ms: float
+    max_render_ms: float
+    avg_latency_ms: float
+    max_latency_ms: float
+
+
+class RealtimeStats(BaseModel):
+    connections: int
+    broadcasts: int
+    sent: int
+    # frames the sent messages went out in, fewer with msgpack clients
+    frames: int
+    evicted: int
+    subscribers: Dict[str, int]
+    max_queue_depth: int
+    avg_queue_depth: float
+    avg_fanout_ms: float
+    p95_fanout_ms: float
+    max_fanout_ms: float
+
+
 class TicketData(BaseModel):
     order_item_id: int
     eat_in: bool
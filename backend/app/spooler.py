@@ -0,0 +1,223 @@
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import logging, queue, threading
+import models, schemas, realtime, printers
+from database import SessionLocal, engine
+
+logger = logging.getLogger('uvicorn.error')
+
+# Print jobs are written to the print_jobs table and fed to their printer by a worker thread per
+# printer, so a request never waits on a printer and an offline printer only holds up its own queue.
+# A job that fails is retried with exponential backoff before it's marked failed, every status change
+# is published to the terminals as a print-job message.
+
+QUEUED = "queued"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 5
+# a drawer popping open half a minute after the cashier gave up on it is worse than pressing again
+MAX_ATTEMPTS_BY_KIND = {"drawer": 1}
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+# With more than one uvicorn worker only one process may drive the printers, two of them writing to the
+# same printer would interleave their jobs. That's the one holding SPOOLER_LOCK, a Postgres advisory lock
+# on a connection it keeps open. The others only store their jobs, the lock holder picks them up within
+# POLL_SECONDS. If it goes away the next to try the lock takes over, the jobs it was printing included.
+SPOOLER_LOCK = 7370001
+POLL_SECONDS = 1.0
+
+
+def backoff(attempts: int) -> float:
+    return min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1))
+
+
+def publish(db_job: models.PrintJob):
+    realtime.manager.publish({"type": "print-job", "payload": schemas.PrintJob.model_validate(db_job).model_dump(mode="json")})
+
+
+class PrinterWorker(threading.Thread):
+    def __init__(self, printer_id: int, finished: Callable[[int], None]):
+        super().__init__(name=f"printer-{printer_id}", daemon=True)
+        self.printer_id = printer_id
+        self.finished = finished
+        self.jobs: "queue.Queue[int]" = queue.Queue()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            job_id = self.jobs.get()
+            if job_id is None:
+                break
+            try:
+                self.process(job_id)
+            except Exception:
+                logger.exception(f"Print job {job_id} could not be processed")
+            finally:
+                self.finished(job_id)
+
+    def stop(self):
+        self.stopping.set()
+        self.jobs.put(None)
+
+    # Send a job, retrying until it's printed or out of attempts. Jobs are handled one at a time so a
+    # printer gets them in the order they were submitted.
+    def process(self, job_id: int):
+        while not self.stopping.is_set():
+            db = SessionLocal()
+            try:
+                db_job = db.get(models.PrintJob, job_id)
+                if db_job is None or db_job.status in (DONE, FAILED):
+                    return
+                printer = printers.get_printer_by_id(db, db_job.printer_id)
+                db_job.status = PRINTING
+                db_job.attempts += 1
+                db.commit()
+                publish(db_job)
+
+                try:
+                    if printer is None:
+                        raise LookupError(f"printer {db_job.printer_id} no longer exists")
+                    printers.send(printer, db_job.data)
+                except Exception as e:
+                    db_job.error = f"Failed to send data to printer: {e}"
+                    max_attempts = MAX_ATTEMPTS_BY_KIND.get(db_job.kind, MAX_ATTEMPTS)
+                    db_job.status = FAILED if db_job.attempts >= max_attempts else QUEUED
+                    db.commit()
+                    publish(db_job)
+                    logger.error(f"Print job {job_id}, attempt {db_job.attempts}: {db_job.error}")
+                    if db_job.status == FAILED:
+                        return
+                    delay = backoff(db_job.attempts)
+                else:
+                    db_job.status = DONE
+                    db_job.error = None
+                    db_job.data = None
+                    db.commit()
+                    publish(db_job)
+                    return
+            finally:
+                db.close()
+            self.stopping.wait(delay)
+
+
+class Spooler:
+    def __init__(self):
+        self.workers: Dict[int, PrinterWorker] = {}
+        self.lock = threading.Lock()
+        # jobs handed to a worker and not finished yet
+        self.dispatched: Set[int] = set()
+        # whether this process holds SPOOLER_LOCK
+        self.leader = False
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def worker(self, printer_id: int) -> PrinterWorker:
+        with self.lock:
+            worker = self.workers.get(printer_id)
+            if worker is None or not worker.is_alive():
+                worker = PrinterWorker(printer_id, self.finished)
+                worker.start()
+                self.workers[printer_id] = worker
+            return worker
+
+    def dispatch(self, job_id: int, printer_id: int):
+        with self.lock:
+            if job_id in self.dispatched:
+                return
+            self.dispatched.add(job_id)
+        self.worker(printer_id).jobs.put(job_id)
+
+    def finished(self, job_id: int):
+        with self.lock:
+            self.dispatched.discard(job_id)
+
+    # Store a job & queue it on its printer, returns right away with the job still queued
+    def submit(self, db: Session, printer: schemas.Printer, data: bytes, kind: str, order_id: int = None) -> models.PrintJob:
+        return self.submit_all(db, [(printer, data)], kind, order_id)[0]
+
+    # Queues a job per printer in one commit, each printer's worker starts on its own right away (or
+    # within POLL_SECONDS when another process drives the printers)
+    def submit_all(self, db: Session, printer_data: List[Tuple[schemas.Printer, bytes]], kind: str, order_id: int = None) -> List[models.PrintJob]:
+        db_jobs = [
+            models.PrintJob(printer_id=printer.id, order_id=order_id, kind=kind, data=bytes(data), status=QUEUED, attempts=0)
+            for printer, data in printer_data
+        ]
+        db.add_all(db_jobs)
+        db.commit()
+        for (printer, _), db_job in zip(printer_data, db_jobs):
+            db.refresh(db_job)
+            publish(db_job)
+            if self.leader:
+                self.dispatch(db_job.id, printer.id)
+        return db_jobs
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.lead, name="spooler", daemon=True)
+        self.thread.start()
+
+    # Tries for SPOOLER_LOCK until it has it, then keeps feeding the workers what other processes queued
+    def lead(self):
+        connection = None
+        while not self.stopping.is_set():
+            try:
+                if connection is None:
+                    # out of the pool, the lock lasts as long as this connection
+                    connection = engine.connect()
+                    connection.detach()
+                if self.leader:
+                    statuses = [QUEUED]
+                else:
+                    self.leader = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SPOOLER_LOCK}).scalar()
+                    # also whatever was being printed when the last lock holder stopped
+                    statuses = [QUEUED, PRINTING]
+                if self.leader:
+                    with Session(bind=connection) as db:
+                        pending = (
+                            db.query(models.PrintJob.id, models.PrintJob.printer_id)
+                            .filter(models.PrintJob.status.in_(statuses))
+                            .order_by(models.PrintJob.id)
+                            .all()
+                        )
+                    if PRINTING in statuses:
+                        logger.info(f"Driving the printers, resuming {len(pending)} print jobs")
+                    for job_id, printer_id in pending:
+                        self.dispatch(job_id, printer_id)
+                connection.commit()
+            except DBAPIError as e:
+                logger.error(f"Print spooler lost its database connection: {e}")
+                if connection is not None:
+                    connection.invalidate()
+                    connection.close()
+                connection = None
+                if self.leader:
+                    # the lock went with the connection, someone else may be printing already
+                    self.leader = False
+                    self.stop_workers()
+            self.stopping.wait(POLL_SECONDS)
+        if connection is not None:
+            connection.close()
+        self.leader = False
+
+    def stop_workers(self):
+        with self.lock:
+            for worker in self.workers.values():
+                worker.stop()
+            self.workers.clear()
+            self.dispatched.clear()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(POLL_SECONDS + 1)
+            self.thread = None
+        self.stop_workers()
+        printers.close_all()
+
+
+spooler = Spooler()
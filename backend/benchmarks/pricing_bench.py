@@ -0,0 +1,197 @@
+# Per call cost of pricing & inventory evaluation before and after the hot paths stopped logging.
+#
+# The "before" functions are the pre-change implementations, kept here verbatim (apart from
+# names) so the comparison can be re-run. uvicorn logs at INFO, so the benchmark does the same
+# with the output going to /dev/null.
+#
+#   cd backend/app && python ../benchmarks/pricing_bench.py
+import logging, os, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/benchmark")  # never connected to
+
+import crud, pricing, schemas
+
+logger = logging.getLogger("uvicorn.error")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+logger.propagate = False
+
+FORM_CFG = [
+    {"type": "single_select", "label": "Size", "order": 0, "options": ["#1", "#2"],
+     "pricing_config": {"priceBy": "Per Option", "dependsOn": {"name": "", "values": {}}, "isBasePrice": True, "priceFactor": "+",
+                        "affectsPrice": True, "constantValue": "0", "perOptionMapping": {"1": "44", "2": "25", "#1": "40", "#2": "32"}}},
+    {"type": "single_select", "label": "Amount Type", "order": 1, "options": ["Bushel", "Dz", "Half bushel"],
+     "pricing_config": {"priceBy": "Dependency", "dependsOn": {"name": "Size", "values": {"Dz": {"#1": "1", "#2": "1"}, "Bushel": {"#1": "3.18", "#2": "0"}, "Half bushel": {"#1": "0", "#2": "0"}}},
+                        "isBasePrice": False, "priceFactor": "×", "affectsPrice": True, "constantValue": "0", "perOptionMapping": {}}},
+    {"type": "number", "label": "Amount", "order": 2, "options": [],
+     "pricing_config": {"priceBy": "Input", "dependsOn": {"name": "", "values": {}}, "isBasePrice": False, "priceFactor": "×",
+                        "affectsPrice": True, "constantValue": "1", "perOptionMapping": {}}},
+    {"type": "single_select", "label": "Spice", "order": 3, "options": ["gar", "hot", "reg"],
+     "pricing_config": {"priceBy": "", "dependsOn": {"name": "", "values": {}}, "isBasePrice": False, "priceFactor": "",
+                        "affectsPrice": False, "constantValue": "0", "perOptionMapping": {}}},
+]
+CONFIGURATIONS = [
+    {"label": "Size", "value": "#1"},
+    {"label": "Amount Type", "value": "Bushel"},
+    {"label": "Amount", "value": "2"},
+    {"label": "Spice", "value": "hot"},
+]
+INVENTORY_CONFIG = schemas.InventoryConfig.model_validate({
+    "dependsOn": {"name": "Size", "amounts": {"#1": "50", "#2": "100"}},
+    "decrementer": "Amount",
+    "decrementDependsOn": {
+        "names": ["Size", "Amount Type"],
+        "amounts": {"#1": {"Dz": "1", "Bushel": "6.666666666666667", "Half bushel": "3.3333333333333335"},
+                    "#2": {"Dz": "1", "Bushel": "9.166666666666666", "Half bushel": "4.583333333333333"}},
+    },
+    "manageItemInventory": True,
+})
+
+
+def before_get_dependency_value(depends_on, item_value, configs):
+    for _, item_config in configs:
+        if item_config.get("label") == depends_on.get("name"):
+            dependency_options = depends_on.get("values").get(item_value)
+            logger.info(f"Dependency Options: {dependency_options}")
+            for k, v in dependency_options.items():
+                if k == item_config.get("value"):
+                    return float(v)
+    return -1
+
+
+def before_calculate_prices(item_config, order_item_config, tax_rate):
+    base_price = 0
+    multipliers = []
+    adders = []
+    selected_values = {}
+    tax_rate = tax_rate / 100
+    configs = list(zip(item_config, order_item_config))
+    configs.sort(
+        key=lambda x: (
+            x[0].get("pricing_config", {}).get("priceBy") == "Option Value",
+            x[0].get("pricing_config", {}).get("priceBy")
+            in ("Scaled Option Value", "Dependency"),
+        )
+    )
+    for form_config, item_config in configs:
+        logger.info("*" * 50)
+        pricing_config = form_config.get("pricing_config", {})
+        logger.info(f"Processing {form_config.get('label')}")
+        price_by = pricing_config.get("priceBy")
+        is_base_price = pricing_config.get("isBasePrice", False)
+        operator = pricing_config.get("priceFactor", "+")
+        item_value = item_config.get("value", 0)
+        selected_values[form_config.get("label")] = item_value
+        logger.info(f"Item value is {item_value}")
+        if price_by in ("Constant", "Input"):
+            value = float(pricing_config.get("constantValue", 0))
+            logger.info(f"'Price by' is constant or input with value {value}")
+            if is_base_price:
+                base_price = crud.apply_operator(operator, value, base_price)
+                logger.info(f"Base price is now {base_price}")
+            else:
+                logger.info("Item is not base price")
+                if operator == "+":
+                    adders.append(value)
+                    logger.info("Operator is +, adding to adders")
+                else:
+                    multipliers.append(value)
+                    logger.info("Operator is x, adding to multipliers")
+        elif price_by == "Per Option":
+            logger.info("'Price by' is per option")
+            value = float(pricing_config.get("perOptionMapping", {}).get(item_value, 0))
+            logger.info(f"Item value {item_value} maps to {value}")
+            if is_base_price:
+                base_price = crud.apply_operator(operator, value, base_price)
+                logger.info(f"Item is base price, base price is now {base_price}")
+            else:
+                logger.info(f"Item is not base price, adding {value} to adders")
+                adders.append(value)
+        elif price_by == "Option Value":
+            value = float(item_value)
+            multipliers.append(value)
+            logger.info(f"'Price by' is option value, adding {value} to multipliers")
+        elif price_by == "Scaled Option Value":
+            value = float(pricing_config.get("constantValue", 0)) * float(item_value)
+            multipliers.append(value)
+            logger.info(f"'Price by' is scaled option value, adding {value} to multipliers")
+        elif price_by == "Dependency":
+            value = before_get_dependency_value(pricing_config["dependsOn"], item_value, configs)
+            logger.info(f"'Price by' is dependency")
+            if operator == "+":
+                logger.info(f"Operator is +, adding {value} to adders")
+                adders.append(value)
+            else:
+                logger.info(f"Operator is x, adding {value} to multipliers")
+                multipliers.append(value)
+    logger.info("*" * 50)
+    final_price = base_price
+    logger.info(f"Base price before modifiers: {base_price}")
+    for multiplier in multipliers:
+        final_price *= multiplier
+        logger.info(f"Applying multiplier {multiplier}, final price is now {final_price}")
+    final_price += sum(adders)
+    logger.info(f"Adding all adders ({sum(adders)} in total), final price is now {final_price}")
+    final_price += final_price * tax_rate
+    logger.info(f"Adding tax ({final_price * tax_rate}), final price is now {final_price}")
+    return (round(max(0, final_price), 2), round(final_price * tax_rate, 2))
+
+
+def before_inventory_change(inventory_config, configurations):
+    amount = 1
+    dependsOn = ''
+    decrementDependsOnValues = [None, None]
+    logger.info(f"OLD INVENTORY AMOUNTS: {inventory_config.dependsOn.amounts}")
+    for comp in configurations:
+        logger.info(f'this comp was fine {comp}')
+        if comp["label"] == inventory_config.decrementer:
+            amount = float(comp["value"])
+            logger.info(f"Found decrementer of {amount} from {comp['label']}")
+        if comp["label"] == inventory_config.dependsOn.name:
+            dependsOn = comp["value"]
+            logger.info(f"Inventory depends on {comp['label']} with user-selected value of {comp['value']}")
+        if comp["label"] in inventory_config.decrementDependsOn.names:
+            index = inventory_config.decrementDependsOn.names.index(comp["label"])
+            decrementDependsOnValues.insert(index, comp["value"])
+            logger.info(f"Found decrement dependency value {comp['value']} from {comp['label']}")
+    logger.info('i made it here')
+    if decrementDependsOnValues[0]:
+        decrementMultipler = inventory_config.decrementDependsOn.amounts[decrementDependsOnValues[0]]
+        if decrementDependsOnValues[1]:
+            decrementMultipler = decrementMultipler[decrementDependsOnValues[1]]
+        logger.info(f"Adjusted decrement multiplier to {decrementMultipler} based on decrement dependencies")
+        amount *= float(decrementMultipler)
+    logger.info(f'decrement {dependsOn} by: {amount}')
+    logger.info(f'NEW INVENTORY AMOUNTS: {inventory_config.dependsOn.amounts}')
+    return dependsOn, amount
+
+
+def per_call(fn, number=20000):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    plan = pricing.PricingPlan(FORM_CFG, 6.625)
+    assert before_calculate_prices(FORM_CFG, CONFIGURATIONS, 6.625) == plan.price(CONFIGURATIONS)
+    assert before_inventory_change(INVENTORY_CONFIG, CONFIGURATIONS) == crud.inventory_change(INVENTORY_CONFIG, CONFIGURATIONS)
+
+    def explain():
+        trace = []
+        plan.finalize(*plan.collect(CONFIGURATIONS, trace), trace)
+
+    rows = [
+        ("pricing, before (logging)", per_call(lambda: before_calculate_prices(FORM_CFG, CONFIGURATIONS, 6.625))),
+        ("pricing, after", per_call(lambda: plan.price(CONFIGURATIONS))),
+        ("pricing, after with explain trace", per_call(explain)),
+        ("inventory change, before (logging)", per_call(lambda: before_inventory_change(INVENTORY_CONFIG, CONFIGURATIONS))),
+        ("inventory change, after", per_call(lambda: crud.inventory_change(INVENTORY_CONFIG, CONFIGURATIONS))),
+        ("inventory change, after with explain trace", per_call(lambda: crud.inventory_change(INVENTORY_CONFIG, CONFIGURATIONS, []))),
+    ]
+    width = max(len(name) for name, _ in rows)
+    for name, micros in rows:
+        print(f"{name:<{width}}  {micros:8.2f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
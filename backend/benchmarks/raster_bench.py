@@ -0,0 +1,38 @@
+# Star raster encoding of receipts of growing height, StarTSPImage (from requirements-dev.txt) against
+# raster.py, in time & bytes. That both print the same dots is checked by tests/test_raster.py.
+#
+#   cd backend/app && python ../benchmarks/raster_bench.py
+import os, random, sys, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+# the same images tests/test_raster.py checks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+import StarTSPImage
+import raster
+from raster_images import html_like, receipt
+
+HEIGHTS = [500, 1000, 2000, 4000, 8000]
+
+
+def per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e3
+
+
+def main():
+    random.seed(0)
+    print(f"{'':>20}  {'StarTSPImage':>27}  {'raster.py':>27}")
+    for height in HEIGHTS:
+        for name, image in (("receipt", receipt(height)), ("html-like", html_like(height))):
+            number = max(1, 2000 // height)
+            before = len(StarTSPImage.imageToRaster(image, True))
+            after = len(raster.image_to_raster(image, True))
+            print(
+                f"{name:>9} {image.height:>5} dots"
+                f"  {per_call(lambda: StarTSPImage.imageToRaster(image, True), number):8.2f} ms {before:>9} bytes"
+                f"  {per_call(lambda: raster.image_to_raster(image, True), number * 10):8.2f} ms {after:>9} bytes"
+            )
+
+
+if __name__ == "__main__":
+    main()
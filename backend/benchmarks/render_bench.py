@@ -0,0 +1,327 @@
+# Time to turn a receipt & a kitchen ticket into the image sent to the printer, with the old
+# wkhtmltoimage (imgkit) renderer and the Pillow layout in layout.py.
+#
+# The "before" functions are the pre-change HTML builders & renderer, kept here verbatim (apart from
+# names and the data they're handed) so the comparison can be re-run. imgkit comes with
+# requirements-dev.txt and needs wkhtmltoimage on the PATH, without it only the Pillow renderer is
+# timed. Pass a directory to also write every rendered image there as a PNG for a side by side look.
+#
+#   cd backend/app && python ../benchmarks/render_bench.py [output dir]
+import math, os, shutil, sys, tempfile, time
+from io import BytesIO
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from PIL import Image
+import layout
+
+RESTAURANT = SimpleNamespace(name="Pelican Seafood", address="1 Harbor Rd", city="Baltimore", state="MD", zip_code="21230")
+TRANSACTION = SimpleNamespace(total_amount=235.21, collected_tax=14.61, payment_method="split", card_paid=200.0, cash_paid=40.0, change_given=4.79)
+ORDER_ID = 1042
+ORDER_DATE = "10/18/2026 01:15:42 PM"
+ORDER_ITEMS = [
+    SimpleNamespace(quantity=2, item_name="Crabs", price=90.0, configurations=[
+        {"label": "Size", "value": "#1"}, {"label": "Amount Type", "value": "Dz"}, {"label": "Amount", "value": "1"}, {"label": "Spice", "value": "hot"},
+    ]),
+    SimpleNamespace(quantity=1, item_name="Shrimp", price=24.5, configurations=[
+        {"label": "Size", "value": "Jumbo"}, {"label": "Amount", "value": "1 lb"}, {"label": "Steamed", "value": "with Old Bay & onions"},
+    ]),
+    SimpleNamespace(quantity=3, item_name="Corn on the cob", price=2.0, configurations=[]),
+    SimpleNamespace(quantity=1, item_name="Crab cake platter with two sides", price=26.5, configurations=[
+        {"label": "Sides", "value": "Fries, coleslaw"},
+    ]),
+]
+CUSTOMER = SimpleNamespace(name="Jordan", phone="410-555-0134", date="10/18/2026", time="01:00 PM")
+
+
+def before_get_style(font_size):
+    res_factor = math.ceil((1 / 25.4) * 203)
+    pad_left_per_px = 0.4226
+    return f"""
+        <style>
+            @import url('https://fonts.googleapis.com/css2?family=Roboto:ital,wght@0,100;0,200;0,300;0,400;0,500;0,700&display=swap');
+            body {{
+                width: {80*res_factor}mm;
+                font-family: Roboto;
+                margin: 0;
+            }}
+            p, span {{
+                margin: {2*res_factor}px 0;
+                font-size: {font_size*res_factor}px;
+                font-weight: 400;
+            }}
+            .center {{
+                text-align: center;
+            }}
+            .item {{
+                display: flex;
+                justify-content: space-between;
+            }}
+            .item-details {{
+                padding-left: {font_size*pad_left_per_px*res_factor}mm;
+            }}
+            hr {{
+                border: none;
+                border-top: {res_factor}px solid #000;
+            }}
+        </style>
+        """
+
+
+def before_receipt_html(db_restaurant, db_order_id, order_date, db_order_items, db_transaction):
+    receipt_style = before_get_style(16)
+    html_content = f"""
+        <html>
+        <head>
+        {receipt_style}
+        </head>
+        <body>
+            <div class="center">
+                <p>{db_restaurant.name}</p>
+                <p>{db_restaurant.address}</p>
+                <p>{db_restaurant.city}, {db_restaurant.state} {db_restaurant.zip_code}</p>
+            </div>
+            <hr />
+            <hr />
+            <div class="center">
+                <p>Order #{db_order_id}, {order_date}</p>
+            </div>
+            <hr />
+            <hr />
+        """
+    for item in db_order_items:
+        html_content += f"""
+            <div class="item">
+                <span>{item.quantity} × {item.item_name}</span>
+                <span>${item.price:.2f}</span>
+            </div>
+            """
+        for config in item.configurations:
+            html_content += f"""
+                <div class="item-details">
+                    <p>{config['label']}: {config['value']}</p>
+                </div>
+                """
+    html_content += f"""
+            <hr />
+            <hr />
+            <div class="item">
+                <span>Subtotal:</span>
+                <span>${(db_transaction.total_amount-db_transaction.collected_tax):.2f}</span>
+            </div>
+            <div class="item">
+                <span>Tax:</span>
+                <span>${db_transaction.collected_tax:.2f}</span>
+            </div>
+            <div class="item">
+                <span>Total:</span>
+                <span>${db_transaction.total_amount:.2f}</span>
+            </div>
+            <hr />
+            <hr />
+        </body>
+        </html>
+        """
+    html_content += f"""
+            <div class="item">
+                <span>Payment Method: {db_transaction.payment_method}</span>
+            </div>
+        """
+    if db_transaction.card_paid > 0:
+        html_content += f"""
+            <div class="item">
+                <span>Card Charged:</span>
+                <span>${db_transaction.card_paid:.2f}</span>
+            </div>
+            """
+        if not (db_transaction.card_paid == db_transaction.total_amount):
+            html_content += f"""
+                <div class="item">
+                    <span>Remaining:</span>
+                    <span>${(db_transaction.total_amount - db_transaction.card_paid):.2f}</span>
+                </div>
+                """
+
+    if db_transaction.cash_paid > 0:
+        html_content += f"""
+            <div class="item">
+                <span>Cash Paid:</span>
+                <span>${db_transaction.cash_paid:.2f}</span>
+            </div>
+            """
+        if not (db_transaction.cash_paid == db_transaction.total_amount):
+            if db_transaction.change_given > 0:
+                html_content += f"""
+                    <div class="item">
+                        <span>Change Due:</span>
+                        <span>${db_transaction.change_given:.2f}</span>
+                    </div>
+                    """
+            else:
+                html_content += f"""
+                    <div class="item">
+                        <span>Card Charged:</span>
+                        <span>${(db_transaction.total_amount - db_transaction.cash_paid):.2f}</span>
+                    </div>
+                    """
+
+    html_content += f"""
+            <hr />
+            <hr />
+            """
+    return html_content
+
+
+def before_ticket_html(order_id, print_date, order_items, customer):
+    res_factor = math.ceil((1 / 25.4) * 203)
+    html_content = f"""
+        <html>
+        <head>
+        {before_get_style(24)}
+        </head>
+        <body>
+        <div class="center" style="margin-top: 400px">
+        """
+    html_content += f"""
+            <p>Order #{order_id}</p>
+            """
+    html_content += f"""
+            <p style="font-size: {18*res_factor}px">Printed on {print_date}</p>
+        </div>
+        """
+    html_content += f"<hr /> <hr />"
+    for item in order_items:
+        html_content += f"""
+            <div class="item">
+                <span>{item.quantity} × {item.item_name}
+            """
+        html_content += f"★EAT IN★"
+        html_content += f"</span></div>"
+        for config in item.configurations:
+            if config["value"]:
+                html_content += f"""
+                    <div class="item-details">
+                        <p>{config['label']}: {config['value']}</p>
+                    </div>
+                    """
+        html_content += f"<hr /> <hr />"
+    html_content += f"""
+        <div class="item">
+            <span>{customer.name}</span>
+            <span>{customer.date}</span>
+        </div>
+        <div class="item">
+            <span>{customer.phone}</span>
+            <span>{customer.time}</span>
+        </div>
+        """
+    return html_content
+
+
+def before_render(content):
+    import imgkit
+
+    res_factor = math.ceil((1 / 25.4) * 203)
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmpfile:
+        tmpfile_path = tmpfile.name
+        imgkit.from_string(
+            content,
+            tmpfile_path,
+            options={"format": "png", "width": res_factor * 80},
+        )
+
+    with open(tmpfile_path, "rb") as f:
+        img = Image.open(BytesIO(f.read()))
+
+    os.remove(tmpfile_path)
+    return img
+
+
+def after_receipt():
+    receipt = layout.ReceiptLayout(16)
+    receipt.text(RESTAURANT.name, center=True)
+    receipt.text(RESTAURANT.address, center=True)
+    receipt.text(f"{RESTAURANT.city}, {RESTAURANT.state} {RESTAURANT.zip_code}", center=True)
+    receipt.rule()
+    receipt.rule()
+    receipt.text(f"Order #{ORDER_ID}, {ORDER_DATE}", center=True)
+    receipt.rule()
+    receipt.rule()
+    for item in ORDER_ITEMS:
+        receipt.row(f"{item.quantity} × {item.item_name}", f"${item.price:.2f}")
+        for config in item.configurations:
+            receipt.text(f"{config['label']}: {config['value']}", details=True)
+    receipt.rule()
+    receipt.rule()
+    receipt.row("Subtotal:", f"${(TRANSACTION.total_amount-TRANSACTION.collected_tax):.2f}")
+    receipt.row("Tax:", f"${TRANSACTION.collected_tax:.2f}")
+    receipt.row("Total:", f"${TRANSACTION.total_amount:.2f}")
+    receipt.rule()
+    receipt.rule()
+    receipt.row(f"Payment Method: {TRANSACTION.payment_method}")
+    receipt.row("Card Charged:", f"${TRANSACTION.card_paid:.2f}")
+    receipt.row("Remaining:", f"${(TRANSACTION.total_amount - TRANSACTION.card_paid):.2f}")
+    receipt.row("Cash Paid:", f"${TRANSACTION.cash_paid:.2f}")
+    receipt.row("Change Due:", f"${TRANSACTION.change_given:.2f}")
+    receipt.rule()
+    receipt.rule()
+    return receipt.render()
+
+
+def after_ticket():
+    ticket = layout.ReceiptLayout(24)
+    ticket.space(400)
+    ticket.text(f"Order #{ORDER_ID}", center=True)
+    ticket.text(f"Printed on {ORDER_DATE}", center=True, font_size=18)
+    ticket.rule()
+    ticket.rule()
+    for item in ORDER_ITEMS:
+        ticket.row(f"{item.quantity} × {item.item_name} ★EAT IN★")
+        for config in item.configurations:
+            if config["value"]:
+                ticket.text(f"{config['label']}: {config['value']}", details=True)
+        ticket.rule()
+        ticket.rule()
+    ticket.row(CUSTOMER.name, CUSTOMER.date)
+    ticket.row(CUSTOMER.phone, CUSTOMER.time)
+    return ticket.render()
+
+
+def per_render(fn, number):
+    fn()  # warm up fonts
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(number):
+            image = fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1e3, image
+
+
+def main(output_dir=None):
+    cases = [
+        ("receipt, pillow", lambda: after_receipt(), 50),
+        ("ticket, pillow", lambda: after_ticket(), 50),
+    ]
+    if shutil.which("wkhtmltoimage"):
+        receipt_html = before_receipt_html(RESTAURANT, ORDER_ID, ORDER_DATE, ORDER_ITEMS, TRANSACTION)
+        ticket_html = before_ticket_html(ORDER_ID, ORDER_DATE, ORDER_ITEMS, CUSTOMER)
+        cases = [
+            ("receipt, imgkit", lambda: before_render(receipt_html), 3),
+            ("ticket, imgkit", lambda: before_render(ticket_html), 3),
+        ] + cases
+    else:
+        print("wkhtmltoimage isn't installed, only timing the Pillow renderer")
+
+    width = max(len(name) for name, _, _ in cases)
+    for name, fn, number in cases:
+        millis, image = per_render(fn, number)
+        print(f"{name:<{width}}  {millis:9.2f} ms/render  {image.width}x{image.height}")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            image.save(os.path.join(output_dir, name.replace(", ", "-") + ".png"))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
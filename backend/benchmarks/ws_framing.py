@@ -0,0 +1,143 @@
+# WebSocket framing on a busy order screen: the server publishes bursts of the messages one change sets
+# off (the order-event, the inventory-delta & the print-job status) to terminals that either take every
+# message as a JSON text frame of its own or negotiated msgpack, which coalesces them into binary frames.
+#
+# Runs realtime.ConnectionManager behind the same endpoint as main.py's /ws/ on a uvicorn server in this
+# process (main itself isn't imported, it needs the database). Reported are the frames per second a
+# terminal had to handle, bytes per message on the wire & the delivery latencies.
+#
+#   cd backend/app && python ../benchmarks/ws_framing.py [terminals] [bursts per second] [seconds]
+import asyncio, json, os, socket, statistics, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import msgpack, uvicorn, websockets
+import realtime
+
+
+def burst(order_id, line_id, sent_at):
+    return [
+        {"type": "order-event", "payload": {
+            "id": line_id * 3, "order_id": order_id, "kind": "item-added", "created_at": "2026-10-18T12:00:00.000000",
+            "payload": {"id": line_id, "item_id": 1, "quantity": 2, "price": 90.0, "tax": 5.96, "printed": False,
+                        "configurations": [{"label": "Size", "value": "#1"}, {"label": "Amount Type", "value": "Dz"},
+                                           {"label": "Amount", "value": "2"}, {"label": "Spice", "value": "hot"}]},
+            "sent_at": sent_at,
+        }},
+        {"type": "inventory-delta", "payload": {
+            "item_id": 1, "buckets": [{"bucket": "#1", "amount": "48.0", "version": line_id}], "sent_at": sent_at,
+        }},
+        {"type": "print-job", "payload": {
+            "id": line_id, "printer_id": 1, "order_id": order_id, "kind": "ticket", "status": "queued", "attempts": 0,
+            "error": None, "created_at": "2026-10-18T12:00:00", "updated_at": "2026-10-18T12:00:00", "sent_at": sent_at,
+        }},
+    ]
+
+
+def app(manager):
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        manager.start(asyncio.get_running_loop())
+        yield
+        manager.stop()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.websocket("/ws/")
+    async def websocket_endpoint(websocket: WebSocket):
+        await manager.connect(websocket)
+        try:
+            while True:
+                manager.receive(websocket, await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError:
+            if websocket in manager.active_connections:
+                raise
+        manager.disconnect(websocket)
+
+    return app
+
+
+def serve(app):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="error"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"ws://127.0.0.1:{sock.getsockname()[1]}/ws/"
+
+
+async def client(url, encoding, stats, ready, stop):
+    subprotocols = [encoding] if encoding else None
+    async with websockets.connect(url, subprotocols=subprotocols, max_size=None, compression=None) as ws:
+        ready.set()
+        while not stop.is_set():
+            try:
+                frame = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            received = time.time()
+            messages = msgpack.unpackb(frame) if isinstance(frame, bytes) else [json.loads(frame)]
+            stats["frames"] += 1
+            stats["bytes"] += len(frame)
+            stats["messages"] += len(messages)
+            stats["latencies"] += [received - message["payload"]["sent_at"] for message in messages]
+
+
+def publish(manager, rate, seconds):
+    started = time.monotonic()
+    count = 0
+    while time.monotonic() - started < seconds:
+        for message in burst(count, count, time.time()):
+            manager.publish(message)
+        count += 1
+        time.sleep(max(0.0, started + count / rate - time.monotonic()))
+    return count
+
+
+async def run(url, encoding, terminals, rate, seconds, manager):
+    stop = asyncio.Event()
+    stats = [{"frames": 0, "bytes": 0, "messages": 0, "latencies": []} for _ in range(terminals)]
+    ready = [asyncio.Event() for _ in range(terminals)]
+    tasks = [asyncio.create_task(client(url, encoding, stats[i], ready[i], stop)) for i in range(terminals)]
+    for event in ready:
+        await event.wait()
+    bursts = await asyncio.get_running_loop().run_in_executor(None, publish, manager, rate, seconds)
+    await asyncio.sleep(1)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats, bursts
+
+
+def main(terminals=50, rate=50, seconds=5):
+    terminals, rate, seconds = int(terminals), float(rate), float(seconds)
+    print("bytes per message      json  msgpack")
+    for message in burst(1234, 5678, time.time()):
+        data = json.dumps(message)
+        print(f"{message['type']:<18} {len(data):>8} {len(realtime.pack(data)):>8}")
+    print(f"\n{terminals} terminals, {rate:g} bursts of 3 messages a second for {seconds:g} s\n")
+    for encoding in (None, realtime.MSGPACK):
+        manager = realtime.ConnectionManager()
+        server, thread, url = serve(app(manager))
+        stats, bursts = asyncio.run(run(url, encoding, terminals, rate, seconds, manager))
+        frames = sum(s["frames"] for s in stats)
+        messages = sum(s["messages"] for s in stats)
+        latencies = sorted(latency for s in stats for latency in s["latencies"])
+        print(
+            f"{encoding or 'json':<8} {messages:>7}/{bursts * 3 * terminals:<7} messages"
+            f"  {frames / terminals / seconds:7.1f} frames/s per terminal"
+            f"  {messages / frames:5.2f} messages/frame"
+            f"  {sum(s['bytes'] for s in stats) / messages:7.1f} bytes/message"
+            f"  p50 {statistics.median(latencies) * 1e3:6.1f} ms  p95 {latencies[int(len(latencies) * 0.95)] * 1e3:6.1f} ms"
+        )
+        server.should_exit = True
+        thread.join(5)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,197 @@
+# WebSocket fan-out under load: a few hundred terminals listening while one of them sends updates, with
+# some of the terminals on "bad Wi-Fi" (tiny receive buffers, never reading), for the old
+# ConnectionManager that awaited every send in turn and the queued one in realtime.py.
+#
+# Both run behind the same endpoint as main.py's /ws/ on a uvicorn server in this process (main itself
+# isn't imported, it needs the database). Reported are the delivery latencies the healthy terminals saw,
+# how many messages reached them before the deadline & the manager's own stats.
+#
+#   cd backend/app && python ../benchmarks/ws_load.py [fast clients] [slow clients] [messages]
+import asyncio, json, os, socket, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from typing import List
+import uvicorn, websockets
+import realtime
+
+# A slow terminal only holds the old broadcast up once the kernel's buffers for it are full, which on
+# loopback can take 4 MB, so the messages are big enough for the default run to get well past that
+MESSAGE_SIZE = 16384
+# a message every SEND_INTERVAL, like a busy night's worth of updates rather than as fast as possible
+SEND_INTERVAL = 0.04
+DEADLINE = 40
+# smaller than in production so slow terminals fall behind within the run
+SEND_QUEUE_SIZE = 32
+
+
+class BeforeConnectionManager:
+    def __init__(self):
+        self.active_connections: List[WebSocket] = []
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+
+    def disconnect(self, websocket: WebSocket):
+        self.active_connections.remove(websocket)
+
+    async def broadcast(self, data: str, sender: WebSocket = None):
+        for connection in self.active_connections:
+            if connection != sender:
+                await connection.send_text(data)
+
+
+def before_app(manager):
+    app = FastAPI()
+
+    @app.websocket("/ws/")
+    async def websocket_endpoint(websocket: WebSocket):
+        await manager.connect(websocket)
+        try:
+            while True:
+                data = await websocket.receive_text()
+                await manager.broadcast(data, sender=websocket)
+        except WebSocketDisconnect:
+            manager.disconnect(websocket)
+            await manager.broadcast(json.dumps({"message": "Device disconnected"}))
+
+    return app
+
+
+def after_app(manager):
+    app = FastAPI()
+
+    @app.websocket("/ws/")
+    async def websocket_endpoint(websocket: WebSocket):
+        await manager.connect(websocket)
+        try:
+            while True:
+                manager.receive(websocket, await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError:
+            if websocket in manager.active_connections:
+                raise
+        manager.disconnect(websocket)
+        manager.send(json.dumps({"message": "Device disconnected"}))
+
+    return app
+
+
+# uvicorn on its own thread & loop, like the real server is to the terminals
+def serve(app):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="error", ws_max_queue=1))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"ws://127.0.0.1:{sock.getsockname()[1]}/ws/"
+
+
+async def fast_client(url, received, ready, stop):
+    async with websockets.connect(url, max_size=None, compression=None) as ws:
+        ready.set()
+        async for message in ws:
+            # "<id> <sent at> <padding>", anything else is a server message
+            if message.startswith("{"):
+                continue
+            id, sent, _ = message.split(" ", 2)
+            received.append(time.monotonic() - float(sent))
+            if id == "-1":
+                break
+        # stay connected until everyone's done
+        await stop.wait()
+
+
+# Does the WebSocket handshake over a socket with a receive buffer of a few KB and then never reads
+# again, so the server's sends to it back up
+async def slow_client(url, stop):
+    host, port = url.split("/")[2].split(":")
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.sock_connect(sock, (host, int(port)))
+        await loop.sock_sendall(sock, (
+            f"GET /ws/ HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            response += await loop.sock_recv(sock, 1)
+        await stop.wait()
+    finally:
+        sock.close()
+
+
+async def run(url, fast, slow, messages, stats):
+    stop = asyncio.Event()
+    slow_tasks = [asyncio.create_task(slow_client(url, stop)) for _ in range(slow)]
+    await asyncio.sleep(0.5)
+    received = [[] for _ in range(fast)]
+    ready = [asyncio.Event() for _ in range(fast)]
+    fast_tasks = [asyncio.create_task(fast_client(url, received[i], ready[i], stop)) for i in range(fast)]
+    for event in ready:
+        await event.wait()
+
+    async def send():
+        padding = "x" * MESSAGE_SIZE
+        async with websockets.connect(url, compression=None) as sender:
+            for id in list(range(messages)) + [-1]:
+                await sender.send(f"{id} {time.monotonic()} {padding}")
+                await asyncio.sleep(SEND_INTERVAL)
+            await asyncio.Event().wait()
+
+    started = time.monotonic()
+    sender = asyncio.create_task(send())
+    while time.monotonic() - started < DEADLINE and sum(len(client) for client in received) < fast * (messages + 1):
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    # before everyone disconnects at once
+    snapshot = stats()
+    stop.set()
+    sender.cancel()
+    await asyncio.wait(fast_tasks, timeout=5)
+    for task in fast_tasks:
+        task.cancel()
+    await asyncio.gather(sender, *slow_tasks, *fast_tasks, return_exceptions=True)
+    return received, elapsed, snapshot
+
+
+def report(name, received, elapsed, expected):
+    latencies = sorted(latency for client in received for latency in client)
+    delivered = sum(len(client) for client in received)
+    line = f"{name:<7} {delivered:>7}/{expected:<7} delivered in {elapsed:6.2f} s"
+    if latencies:
+        line += (
+            f"  p50 {latencies[len(latencies) // 2] * 1e3:8.1f} ms"
+            f"  p95 {latencies[int(len(latencies) * 0.95)] * 1e3:8.1f} ms"
+            f"  max {latencies[-1] * 1e3:8.1f} ms"
+        )
+    print(line)
+
+
+def main(fast=200, slow=20, messages=400):
+    fast, slow, messages = int(fast), int(slow), int(messages)
+    realtime.SEND_QUEUE_SIZE = SEND_QUEUE_SIZE
+    print(f"{fast} terminals, {slow} of them slow on top, {messages + 1} messages of {MESSAGE_SIZE // 1024} KB each\n")
+    for name, make_app, manager in (
+        ("before", before_app, BeforeConnectionManager()),
+        ("after", after_app, realtime.ConnectionManager()),
+    ):
+        server, thread, url = serve(make_app(manager))
+        received, elapsed, stats = asyncio.run(run(url, fast, slow, messages, getattr(manager, "stats", dict)))
+        report(name, received, elapsed, fast * (messages + 1))
+        if stats:
+            print("        " + json.dumps({key: round(value, 2) if isinstance(value, float) else value for key, value in stats.items()}))
+        server.should_exit = True
+        thread.join(5)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,22 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+
+# The app's database module, for tests that need Postgres. They're skipped unless DATABASE_URL points at
+# one that's up, and write throwaway rows to it that they clean up after themselves.
+@pytest.fixture(scope="session")
+def database():
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        pytest.skip("DATABASE_URL isn't set")
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import OperationalError
+    try:
+        create_engine(url).connect().close()
+    except OperationalError as e:
+        pytest.skip(f"Postgres isn't available: {e}")
+    import database, models
+    models.Base.metadata.create_all(bind=database.engine)
+    return database
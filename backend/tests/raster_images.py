@@ -0,0 +1,27 @@
+# Images raster.py is checked with in test_raster.py & timed on in benchmarks/raster_bench.py
+from PIL import Image, ImageDraw
+import layout
+
+
+# A receipt drawn by layout.py, padded with item lines until it's at least height dots tall
+def receipt(height):
+    receipt = layout.ReceiptLayout(16)
+    receipt.text("Pelican Seafood", center=True)
+    receipt.rule()
+    receipt.rule()
+    count = 0
+    while receipt.flow()[1] < height:
+        count += 1
+        receipt.row(f"{count} × Crabs", f"${count * 45:.2f}")
+        receipt.text("Size: #1", details=True)
+    return receipt.render()
+
+
+# Something a browser would have produced, antialiased grey at 640 px
+def html_like(height):
+    image = Image.new("RGB", (640, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 40):
+        draw.text((10, y), f"{y} × Crabs with Old Bay      ${y / 7:.2f}", fill=(0, 0, 0))
+        draw.line((0, y + 30, 639, y + 30), fill=(90, 90, 90), width=3)
+    return image
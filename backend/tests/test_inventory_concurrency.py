@@ -0,0 +1,83 @@
+# Many add_to_active_order calls at one item from parallel sessions, like several tablets selling the
+# same thing during a rush: no inventory decrement or quantity increment may be lost, and an order keeps
+# a single line per configuration.
+import random, uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+WORKERS = 16
+ADDS = 400
+TABLETS = 4
+STARTING_STOCK = 100000
+CONFIGURATIONS = [{"label": "Note", "value": "concurrency"}]
+INVENTORY_CONFIG = {
+    "dependsOn": {"name": "none", "amounts": {"": str(STARTING_STOCK)}},
+    "decrementer": "1_per_order",
+    "decrementDependsOn": {"names": [], "amounts": {}},
+    "manageItemInventory": True,
+}
+
+
+@pytest.fixture
+def item_and_orders(database):
+    import crud, models, schemas
+    db = database.SessionLocal()
+    try:
+        category = db.query(models.Category).first()
+        if category is None:
+            category = models.Category(name="concurrency", proper_name="Concurrency")
+            db.add(category)
+            db.commit()
+        item = crud.create_item(db, schemas.ItemCreate(
+            name=f"concurrency-{uuid.uuid4().hex[:8]}",
+            form_cfg=[],
+            category_id=category.id,
+            tax_rate=0,
+            inventory_config=INVENTORY_CONFIG,
+        ))
+        item_id, order_ids = item.id, [crud.create_order(db).id for _ in range(TABLETS)]
+    finally:
+        db.close()
+    yield item_id, order_ids
+    db = database.SessionLocal()
+    try:
+        db.query(models.Order).filter(models.Order.id.in_(order_ids)).delete(synchronize_session=False)
+        db.query(models.Item).filter(models.Item.id == item_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_concurrent_adds(database, item_and_orders):
+    from sqlalchemy import func
+    import crud, models
+    item_id, order_ids = item_and_orders
+
+    def add(order_id):
+        db = database.SessionLocal()
+        try:
+            crud.add_to_active_order(db, crud.get_order(db, order_id), crud.get_item(db, item_id), CONFIGURATIONS)
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for future in [pool.submit(add, random.choice(order_ids)) for _ in range(ADDS)]:
+            future.result()
+
+    db = database.SessionLocal()
+    try:
+        balance = crud.get_inventory_balances(db, [item_id])[item_id][""]
+        lines = db.query(models.OrderItem.order_id, func.count(), func.sum(models.OrderItem.quantity)).filter(
+            models.OrderItem.item_id == item_id
+        ).group_by(models.OrderItem.order_id).all()
+        # the orders are still pending, so everything sold is held as reservations
+        reserved = db.query(func.sum(models.InventoryReservation.amount)).filter(
+            models.InventoryReservation.item_id == item_id
+        ).scalar()
+    finally:
+        db.close()
+
+    assert balance == STARTING_STOCK - ADDS, "lost inventory decrements"
+    assert sum(sold for _, _, sold in lines) == ADDS, "lost quantity increments"
+    assert all(count == 1 for _, count, _ in lines), "the same configuration was added as separate lines"
+    assert reserved == ADDS, "reservations don't match the balance"
@@ -0,0 +1,92 @@
+# raster.py against StarTSPImage, which the printers were driven with before: to_bitmap has to come out
+# with the very same dots, and encode's command stream, played back the way the printer reads it, has
+# to print that bitmap line for line.
+import re
+import numpy as np
+import pytest
+from PIL import Image
+import raster
+from raster_images import html_like, receipt
+
+StarTSPImage = pytest.importorskip("StarTSPImage")
+
+HEADER = raster.ENTER_RASTER + raster.CONTINUOUS_MODE
+
+
+def noise(width, height, mode):
+    pixels = np.random.default_rng(width * height).integers(0, 256, (height, width), dtype=np.uint8)
+    return Image.fromarray(pixels, "L").convert(mode)
+
+
+IMAGES = {
+    "receipt": lambda: receipt(300),
+    "receipt-grey": lambda: receipt(300).convert("L"),
+    "html-like": lambda: html_like(300),
+    "noise-L": lambda: noise(raster.WIDTH, 200, "L"),
+    "noise-RGB": lambda: noise(640, 200, "RGB"),
+    "noise-1-narrow": lambda: noise(300, 150, "1"),
+    "noise-RGBA-wide": lambda: noise(1000, 123, "RGBA"),
+    "one-white-line": lambda: Image.new("1", (raster.WIDTH, 1), 1),
+}
+
+
+# StarTSPImage sends every line whole, b 72 0 & the line's bytes, so its stream cut into lines is its bitmap
+def star_bitmap(image, cut=True):
+    data = bytes(StarTSPImage.imageToRaster(image, cut))
+    start = len(HEADER) + (0 if cut else len(raster.EOT_NO_CUT))
+    lines = np.frombuffer(data[start : -len(raster.QUIT_RASTER)], dtype=np.uint8).reshape(-1, 3 + raster.BYTES_PER_LINE)
+    assert (lines[:, :3] == raster.LINE_HEADER).all()
+    return lines[:, 3:]
+
+
+# The raster lines a command stream prints & whether it cuts at the end
+def play(data):
+    assert data.startswith(HEADER) and data.endswith(raster.QUIT_RASTER)
+    data = data[len(HEADER) : -len(raster.QUIT_RASTER)]
+    cut = not data.startswith(raster.EOT_NO_CUT)
+    i = 0 if cut else len(raster.EOT_NO_CUT)
+    lines = []
+    while i < len(data):
+        if data[i] == ord("b"):
+            length = data[i + 1] + data[i + 2] * 256
+            assert length <= raster.BYTES_PER_LINE
+            lines.append(data[i + 3 : i + 3 + length].ljust(raster.BYTES_PER_LINE, b"\x00"))
+            i += 3 + length
+        else:
+            feed = re.match(rb"\x1b\*rY(\d+)\x00", data[i:])
+            # the printer feeds 1 to 255 lines a command
+            assert feed and 0 < int(feed[1]) <= 255
+            lines += [bytes(raster.BYTES_PER_LINE)] * int(feed[1])
+            i += feed.end()
+    return lines, cut
+
+
+@pytest.mark.parametrize("name", IMAGES)
+def test_bitmap_matches_startspimage(name):
+    image = IMAGES[name]()
+    bitmap = raster.to_bitmap(image)
+    expected = star_bitmap(image)
+    assert bitmap.shape == expected.shape
+    assert bitmap.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize("cut", [True, False])
+@pytest.mark.parametrize("name", IMAGES)
+def test_encode_prints_the_bitmap(name, cut):
+    image = IMAGES[name]()
+    bitmap = raster.to_bitmap(image)
+    lines, cuts = play(raster.encode(bitmap, cut))
+    assert cuts == cut
+    assert lines == [row.tobytes() for row in bitmap]
+    assert play(raster.image_to_raster(image, cut)) == play(bytes(StarTSPImage.imageToRaster(image, cut)))
+
+
+# Blank runs longer than one feed command takes, a dot in the last byte of a line & a blank last line
+def test_encode_edges():
+    bitmap = np.zeros((3 * raster.MAX_FEED + 7, raster.BYTES_PER_LINE), dtype=np.uint8)
+    bitmap[0, 0] = 0x80
+    bitmap[raster.MAX_FEED + 1, -1] = 0x01
+    bitmap[-2, :] = 0xFF
+    lines, _ = play(raster.encode(bitmap))
+    assert lines == [row.tobytes() for row in bitmap]
+    assert play(raster.encode(np.zeros((0, raster.BYTES_PER_LINE), dtype=np.uint8))) == ([], True)
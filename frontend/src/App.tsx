@@ -10,7 +10,7 @@ import Login from './components/Login'
 import { UserContext } from './components/BaseComps/contexts/UserContext'
 import Reports from './components/Reports'
 import { WebSocketProvider } from './components/BaseComps/contexts/WebSocketContext'
-import { WEBSOCKET_URL } from './components/Constants'
+import { WEBSOCKET_URL, WEBSOCKET_TOPICS } from './components/Constants'
 
 const AppRoutes = () => {
   const { authValid, authChecked, user } = useContext(UserContext)
@@ -54,7 +54,7 @@ const AppRoutes = () => {
 
 export default function App() {
   return (
-    <WebSocketProvider url={WEBSOCKET_URL}>
+    <WebSocketProvider url={WEBSOCKET_URL} topics={WEBSOCKET_TOPICS}>
       <BrowserRouter>
         <AppRoutes />
       </BrowserRouter>
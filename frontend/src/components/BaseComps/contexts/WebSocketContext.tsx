@@ -14,9 +14,11 @@ const WebSocketContext = createContext<{
 type WebSocketProviderProps = {
     children: React.ReactNode;
     url: string;
+    // topics the server should send, everything when left out
+    topics?: string[];
 };
 
-const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children, url }) => {
+const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children, url, topics }) => {
     const [webSocket, setWebSocket] = useState<WebSocket | null>(null);
     const [lastMessage, setLastMessage] = useState<string | null>(null);
     const [isConnected, setIsConnected] = useState<boolean>(false);
@@ -26,6 +28,9 @@ const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children, url })
 
         ws.onopen = () => {
             console.log('WebSocket Connected');
+            if (topics) {
+                ws.send(JSON.stringify({ type: 'subscribe', topics }));
+            }
             setIsConnected(true);
         };
 
@@ -48,7 +53,7 @@ const WebSocketProvider: React.FC<WebSocketProviderProps> = ({ children, url })
         return () => {
             ws.close();
         };
-    }, [url]);
+    }, [url, topics]);
 
     const sendMessage = (message: string) => {
         if (webSocket && isConnected) {
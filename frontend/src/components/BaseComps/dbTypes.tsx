@@ -107,4 +107,16 @@ type Order = AdditionalOrderInfo & {
     transaction: Transaction;
 }
 
-export type { PricingDependency, PricingConfig, FormValue, FormComponentConfig, Item, Category, CategoryWithItems, OrderItems, Order, AdditionalOrderInfo, Transaction, InventoryConfig, InventoryDependency, InventoryDecrementDependency}
\ No newline at end of file
+type PrintJob = {
+    id: number;
+    printer_id: number;
+    order_id?: number | null;
+    kind: string;
+    status: 'queued' | 'printing' | 'done' | 'failed';
+    attempts: number;
+    error?: string | null;
+    created_at: string;
+    updated_at: string;
+}
+
+export type { PrintJob, PricingDependency, PricingConfig, FormValue, FormComponentConfig, Item, Category, CategoryWithItems, OrderItems, Order, AdditionalOrderInfo, Transaction, InventoryConfig, InventoryDependency, InventoryDecrementDependency}
\ No newline at end of file
@@ -1,6 +1,9 @@
 export const DRAWER_WIDTH = 260;
 export const POPUP_FADE_DURATION = 200;
 export const WEBSOCKET_URL = 'ws://localhost/ws/';
+// what the terminals listen for on the WebSocket: orders, menu changes & print job statuses (inventory deltas
+// aren't shown anywhere yet)
+export const WEBSOCKET_TOPICS = ['orders', 'menu', 'printing'];
 export const RESTAURANT_NAME = 'Shags Crab and Seafood';
 export const RESTAURANT_ADDRESS_L1 = '1045 South Broadway';
 export const RESTAURANT_ADDRESS_L2 = 'Pennsville, NJ 08079';
\ No newline at end of file
@@ -7,10 +7,12 @@ import { LogoutOutlined } from '@mui/icons-material';
 import NotesOutlinedIcon from '@mui/icons-material/NotesOutlined';
 import { UserContext } from './BaseComps/contexts/UserContext';
 import Logo from './BaseComps/Logo';
+import { watchPrintJobs } from './Orders/PrintJobAlerts';
 
 export const handleOpenCashDrawer = async () => {
   try {
-    await axios.post('/open-drawer/');
+    const res = await axios.post('/open-drawer/');
+    watchPrintJobs(res.data);
   } catch (error) {
     console.error('Error opening cash drawer:', error);
   }
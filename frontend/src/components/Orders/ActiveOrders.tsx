@@ -10,6 +10,7 @@ import { FormConfigProvider } from "../Configuration/contexts/FormConfigContext"
 import { ItemProvider } from "../Configuration/contexts/ItemContext"
 import { useParams } from "react-router"
 import Snackbar from "../BaseComps/Snackbar"
+import PrintJobAlerts from "./PrintJobAlerts"
 import { OriginalOrderInfoProvider } from "./contexts/OriginalOrderInfoContext"
 import OrderFormEdit from "./OrderFormEdit"
 
@@ -37,6 +38,7 @@ export default function ActiveOrders() {
                                 </React.Fragment>
                             }
                             <Snackbar />
+                            <PrintJobAlerts />
                     </OriginalOrderInfoProvider>
                 </OrderProvider>
             </UIProvider>
@@ -12,6 +12,7 @@ import dayjs, { Dayjs } from 'dayjs';
 import { AdditionalOrderInfo, Order } from '../BaseComps/dbTypes';
 import { handleOpenCashDrawer } from '../Landing';
 import { WebSocketContext } from '../BaseComps/contexts/WebSocketContext';
+import { watchPrintJobs } from './PrintJobAlerts';
 
 interface PricingTotals {
     total_non_taxable: number;
@@ -123,7 +124,8 @@ export default function Checkout({ open, onClose, pricingTotals }: CheckoutProps
         if (printReceipt) {
             const printUrl = `/orders/${activeOrder.id}/print_receipt`;
             try {
-                await axios.post(printUrl);
+                const res = await axios.post(printUrl);
+                watchPrintJobs(res.data);
             }
             catch (error) {
                 console.error(error);
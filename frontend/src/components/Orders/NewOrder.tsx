@@ -7,6 +7,7 @@ import { UIProvider } from "../BaseComps/contexts/UIContext"
 import { OrderProvider } from "./contexts/OrderContext"
 import { useParams } from "react-router"
 import Snackbar from "../BaseComps/Snackbar"
+import PrintJobAlerts from "./PrintJobAlerts"
 import { Box } from "@mui/material"
 import { OriginalOrderInfoProvider } from "./contexts/OriginalOrderInfoContext"
 
@@ -27,6 +28,7 @@ export default function NewOrder() {
                                 <NewOrderLanding />
                             }
                             <Snackbar />
+                            <PrintJobAlerts />
                     </OriginalOrderInfoProvider>
                 </OrderProvider>
             </UIProvider >
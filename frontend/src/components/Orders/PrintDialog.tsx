@@ -7,6 +7,7 @@ import { List, ListItem, Typography, Stack } from '@mui/material';
 import { OrderItems } from '../BaseComps/dbTypes';
 import axios from 'axios';
 import { OrderInfoAccordion } from './OrderItemDetails';
+import { watchPrintJobs } from './PrintJobAlerts';
 
 let resolveDialog: (() => void) | null = null;
 
@@ -64,7 +65,7 @@ function shuffle(array: Array<any>) {
 
 
 export default function PrintDialog() {
-    const { openDialog, setOpenDialog } = useContext(UIContext);
+    const { openDialog, setOpenDialog, setSnackbarMessage, setOpenSnackbar } = useContext(UIContext);
     const { orderItems, activeOrder, setOrderItems } = useContext(OrderContext);
     const categories = useMemo(() => getUniqueCategories(orderItems), [orderItems]);
     const [tickets, setTickets] = useState<number[]>([]);
@@ -161,47 +162,21 @@ export default function PrintDialog() {
         const printUrl = `/orders/${activeOrder.id}/print_tickets`;
 
         try {
-            await axios.post(printUrl, payload);
-            await updateAllOrderItems();
-        }
-        catch (error) {
-            console.error(error);
-        }
-    }
-
-    const orderItemUpdatePrinted = async (orderItem: OrderItems, index: number) => {
-        console.log('orderItem:', orderItem);
-        if (orderItem.printed) return;
-        const wasPrinted = printTickets.includes(rowVals[index].ticket);
-        const updateUrl = `/orders-items/${orderItem.id}/update`;
-
-        try {
-            await axios.patch(updateUrl, { printed: wasPrinted })
+            // the server marks the printed lines along with queueing the tickets
+            const res = await axios.post(printUrl, payload);
+            watchPrintJobs(res.data);
             if (activeOrder.status === 'pending') return;
-            setOrderItems((prevOrderItems) => {
-                const newOrderItems = [...prevOrderItems];
-                newOrderItems[index].printed = wasPrinted;
-                return newOrderItems;
-            });
+            setOrderItems((prevOrderItems) => prevOrderItems.map((orderItem, index) =>
+                printTickets.includes(rowVals[index].ticket) ? { ...orderItem, printed: true } : orderItem
+            ));
         }
         catch (error) {
             console.error(error);
+            setSnackbarMessage('Error printing tickets');
+            setOpenSnackbar(true);
         }
     }
 
-    const updateAllOrderItems = async () => {
-        const updatePromises = orderItems.map((orderItem, index) =>
-            orderItemUpdatePrinted(orderItem, index)
-        );
-
-        try {
-            await Promise.all(updatePromises);
-            console.log('All order items updated successfully');
-        } catch (error) {
-            console.error('Error updating one or more order items:', error);
-        }
-    };
-
 
     const handleCloseDialog = () => {
         doResolveDialog();
@@ -0,0 +1,38 @@
+import { useContext, useEffect } from 'react';
+import { UIContext } from '../BaseComps/contexts/UIContext';
+import { WebSocketContext } from '../BaseComps/contexts/WebSocketContext';
+import { PrintJob } from '../BaseComps/dbTypes';
+
+// print jobs sent from this terminal that haven't finished yet, kept across pages
+const pendingJobs = new Set<number>();
+
+export const watchPrintJobs = (jobs: PrintJob | PrintJob[]) => {
+    (Array.isArray(jobs) ? jobs : [jobs]).forEach(job => pendingJobs.add(job.id));
+};
+
+// The server queues receipts, tickets & drawer kicks and retries a printer a few times before giving up,
+// so a print request succeeding doesn't mean anything got printed. Lets the cashier know when one of
+// theirs failed.
+export default function PrintJobAlerts() {
+    const { setSnackbarMessage, setOpenSnackbar } = useContext(UIContext);
+    const { lastMessage } = useContext(WebSocketContext);
+
+    useEffect(() => {
+        const messageData = JSON.parse(lastMessage || '{}');
+        if (messageData.type !== 'print-job') return;
+        const job: PrintJob = messageData.payload;
+        if (!pendingJobs.has(job.id)) return;
+        if (job.status === 'done') {
+            pendingJobs.delete(job.id);
+        }
+        else if (job.status === 'failed') {
+            pendingJobs.delete(job.id);
+            const kind = job.kind.charAt(0).toUpperCase() + job.kind.slice(1);
+            const failure = job.kind === 'drawer' ? 'Cash drawer failed to open' : `${kind} failed to print`;
+            setSnackbarMessage(`${failure}${job.order_id ? ` for order #${job.order_id}` : ''}: ${job.error || 'printer unavailable'}`);
+            setOpenSnackbar(true);
+        }
+    }, [lastMessage]);
+
+    return null;
+}